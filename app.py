@@ -1,11 +1,91 @@
 import tkinter as tk
-from tkinter import filedialog, messagebox, Listbox, Scrollbar, Toplevel
-from PIL import Image, ImageTk
+from tkinter import filedialog, messagebox, Toplevel
+from PIL import Image
 import os
-from utils import save_annotations
+import time
+import numpy as np
+from utils import save_annotations, load_annotations, FORMAT_EXTENSIONS
+from render import TiledCanvasRenderer
+from scene import AnnotationLayer
+from spatial import GridIndex
+from store import AnnotationStore, LabelIndex, canvas_to_image
+from listview import VirtualList, Filmstrip
+from thumbnails import ThumbnailCache
+from dataset import DatasetSession, annotation_path, read_annotation_file
+from journal import EditJournal
+from loader import LazyPyramid, DEFAULT_MEMORY_BUDGET
+from wand import MagicWand, DEFAULT_TOLERANCE
+
+HIT_TOLERANCE = 4 # canvas pixels
+FRAME_INTERVAL = 16 # ms, about 60 frames per second
+WAND_POLL_INTERVAL = 10 # ms between checks for a finished magic-wand selection
+JOURNAL_CHECK_INTERVAL = 1000 # ms between checks for autosave write errors
+
+class FrameScheduler:
+    """Coalesces pan, zoom, drag and preview input into at most one render per frame.
+
+    Handlers record the latest state here instead of drawing. Pending zooms
+    and pans are folded into one view transform: the zoom is multiplied by
+    scale and the image offset o becomes o * scale + shift. Only the most
+    recent drag and hover positions are kept. However many events arrive, the
+    work is one render per FRAME_INTERVAL, run from after_idle/after.
+    """
+    def __init__(self, root, render, interval=FRAME_INTERVAL):
+        self.root = root
+        self.render = render
+        self.interval = interval
+        self.job = None
+        self.last_frame = 0.0
+        self.reset()
+
+    def reset(self):
+        self.scale, self.shift_x, self.shift_y = 1.0, 0.0, 0.0
+        self.drag = None
+        self.hover = None
+
+    def zoom(self, factor, x, y):
+        """Zoom by factor around canvas point (x, y)."""
+        self.scale *= factor
+        self.shift_x = self.shift_x * factor + x * (1 - factor)
+        self.shift_y = self.shift_y * factor + y * (1 - factor)
+        self.request()
+
+    def pan(self, dx, dy):
+        self.shift_x += dx
+        self.shift_y += dy
+        self.request()
+
+    def set_drag(self, x, y):
+        self.drag = (x, y)
+        self.request()
+
+    def set_hover(self, x, y):
+        self.hover = (x, y)
+        self.request()
+
+    def request(self):
+        if self.job: return
+        wait = self.interval - (time.perf_counter() - self.last_frame) * 1000
+        self.job = self.root.after_idle(self.flush) if wait <= 0 else self.root.after(int(wait), self.flush)
+
+    def cancel(self):
+        if self.job:
+            self.root.after_cancel(self.job)
+            self.job = None
+        self.reset()
+
+    def flush(self):
+        """Render the pending state now. Also used to settle input before a release or click."""
+        if self.job:
+            self.root.after_cancel(self.job)
+            self.job = None
+        frame = (self.scale, self.shift_x, self.shift_y, self.drag, self.hover)
+        self.reset()
+        self.last_frame = time.perf_counter()
+        self.render(*frame)
 
 class BboxCoordinatesPicker:
-    def __init__(self, root):
+    def __init__(self, root, preview_resample=Image.Resampling.BILINEAR, final_resample=Image.Resampling.LANCZOS, refine_delay=200, memory_budget=DEFAULT_MEMORY_BUDGET):
         self.root = root
         self.root.title("Image Annotation Tool")
         self.root.geometry("1200x800")
@@ -28,15 +108,33 @@ class BboxCoordinatesPicker:
         self.upload_button = tk.Button(top_frame, text="Upload Image", command=self.upload_image)
         self.upload_button.pack(side="left", padx=5)
 
+        # --- Dataset navigation ---
+        self.open_folder_button = tk.Button(top_frame, text="Open Folder", command=self.open_folder)
+        self.open_folder_button.pack(side="left", padx=5)
+        self.prev_button = tk.Button(top_frame, text="< Prev", command=self.previous_image, state="disabled")
+        self.prev_button.pack(side="left")
+        self.next_button = tk.Button(top_frame, text="Next >", command=self.next_image, state="disabled")
+        self.next_button.pack(side="left")
+        self.position_label = tk.Label(top_frame, text="")
+        self.position_label.pack(side="left", padx=5)
+
         # --- Drawing Mode Selection ---
         self.draw_mode = tk.StringVar(value="BBox")
         tk.Label(top_frame, text="Mode:").pack(side="left", padx=(10,2))
         tk.Radiobutton(top_frame, text="BBox", variable=self.draw_mode, value="BBox", command=self.cancel_drawing).pack(side="left")
         tk.Radiobutton(top_frame, text="Polygon", variable=self.draw_mode, value="Polygon", command=self.cancel_drawing).pack(side="left")
+        tk.Radiobutton(top_frame, text="Wand", variable=self.draw_mode, value="Wand", command=self.on_wand_mode).pack(side="left")
+        tk.Label(top_frame, text="Tolerance:").pack(side="left", padx=(5,2))
+        self.wand_tolerance = tk.IntVar(value=DEFAULT_TOLERANCE)
+        tk.Spinbox(top_frame, from_=0, to=255, width=4, textvariable=self.wand_tolerance).pack(side="left")
 
         # Canvas for image display
         self.canvas = tk.Canvas(self.canvas_frame, cursor="cross", bg="black")
         self.canvas.pack(fill="both", expand=True)
+        self.renderer = TiledCanvasRenderer(self.canvas)
+        self.annotations = AnnotationStore()
+        self.spatial_index = GridIndex()
+        self.layer = AnnotationLayer(self.canvas, self.annotations, self.spatial_index)
 
         # --- Bottom bar for controls ---
         bottom_frame = tk.Frame(self.canvas_frame)
@@ -45,19 +143,20 @@ class BboxCoordinatesPicker:
         # --- Left Panel Widgets ---
         tk.Label(self.left_frame, text="Annotations", font=("Helvetica", 12, "bold")).pack(pady=5)
         
-        self.annotation_list_frame = tk.Frame(self.left_frame)
-        self.annotation_list_frame.pack(fill="both", expand=True, padx=5)
-        
-        self.annotation_listbox = Listbox(self.annotation_list_frame, selectmode=tk.SINGLE)
-        self.annotation_listbox.pack(side="left", fill="both", expand=True)
-        
-        self.annotation_scrollbar = Scrollbar(self.annotation_list_frame, orient="vertical", command=self.annotation_listbox.yview)
-        self.annotation_scrollbar.pack(side="right", fill="y")
-        self.annotation_listbox.config(yscrollcommand=self.annotation_scrollbar.set)
-        self.annotation_listbox.bind("<<ListboxSelect>>", self.on_annotation_select)
+        # Filter by label; the menu lists every label with its count
+        self.label_index = LabelIndex()
+        self.label_filter = None # None shows every annotation
+        self.filter_text = tk.StringVar(value="All labels (0)")
+        self.filter_menu = tk.OptionMenu(self.left_frame, self.filter_text, "")
+        self.filter_menu.pack(fill="x", padx=5)
+
+        self.annotation_list = VirtualList(self.left_frame, self.annotation_row_text, on_select=self.on_annotation_select)
+        self.annotation_list.pack(fill="both", expand=True, padx=5)
 
         self.delete_button = tk.Button(self.left_frame, text="Delete Selected", command=self.delete_selected_annotation)
         self.delete_button.pack(pady=5)
+        self.relabel_button = tk.Button(self.left_frame, text="Relabel Selected", command=self.relabel_selected)
+        self.relabel_button.pack(pady=(0, 5))
 
         # --- Bottom Bar Widgets ---
         # Label Entry
@@ -71,13 +170,22 @@ class BboxCoordinatesPicker:
 
         self.save_annotation_button = tk.Button(bottom_frame, text="Save Annotations", command=self.save_annotation_dialog)
         self.save_annotation_button.pack(side="right", padx=5)
+        self.import_annotation_button = tk.Button(bottom_frame, text="Import Annotations", command=self.import_annotation_dialog)
+        self.import_annotation_button.pack(side="right", padx=5)
 
         # --- Class attributes ---
-        self.original_image = None
+        self.pyramid = None
         self.image_path = None
-        self.tk_image = None
-        self.annotations = []
-        self.selected_annotation_index = -1
+        self.session = None
+        self.journal = None # EditJournal of the current image
+        self.journal_job = None
+        self.journal_error = None # last autosave error shown in the status bar
+        self.closing = {} # image path -> closed EditJournal still writing its final snapshot
+        self.closing_job = None
+        self.thumbnails = None # ThumbnailCache, started with the first folder
+        self.filmstrip = None
+        self.wand = None # MagicWand of the current image, made when Wand mode is used
+        self.selected_ids = set()
         
         # Drawing state
         self.drawing = False
@@ -85,6 +193,8 @@ class BboxCoordinatesPicker:
         self.current_rect_id = None
         self.current_polygon_points = []
         self.current_polygon_id = None
+        self.band_start = None
+        self.band_rect_id = None
 
         # Pan and Zoom state
         self.pan_start_x, self.pan_start_y = 0, 0
@@ -92,6 +202,14 @@ class BboxCoordinatesPicker:
         self.zoom_level = 1.0
         self.resize_job = None
 
+        # Progressive rendering: a fast preview while zooming/panning, refined once input is idle
+        self.preview_resample = preview_resample
+        self.final_resample = final_resample
+        self.refine_delay = refine_delay
+        self.refine_job = None
+        self.frames = FrameScheduler(self.root, self.render_frame)
+        self.memory_budget = memory_budget # bytes of decoded pixels kept per image
+
         # --- Bindings ---
         self.canvas_frame.bind("<Configure>", self.on_window_resize)
         self.canvas.bind("<ButtonPress-1>", self.on_button_press)
@@ -104,8 +222,13 @@ class BboxCoordinatesPicker:
         self.root.bind("<KeyPress-Return>", self.finish_polygon) # Enter key
         self.root.bind("<ButtonPress-3>", self.finish_polygon) # Right-click
         self.root.bind("<Escape>", self.cancel_drawing)
-        self.root.bind("<KeyPress-Delete>", self.delete_selected_annotation)
-        self.root.bind("<KeyPress-BackSpace>", self.delete_selected_annotation)
+        self.root.bind("<KeyPress-Delete>", self.on_delete_key)
+        self.root.bind("<KeyPress-BackSpace>", self.on_delete_key)
+        for key, dx, dy in (("Left", -1, 0), ("Right", 1, 0), ("Up", 0, -1), ("Down", 0, 1)):
+            self.root.bind(f"<KeyPress-{key}>", lambda event, dx=dx, dy=dy: self.on_nudge(event, dx, dy))
+        self.root.bind("<Next>", self.next_image) # Page Down
+        self.root.bind("<Prior>", self.previous_image) # Page Up
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
 
     def on_window_resize(self, event=None):
         if self.resize_job:
@@ -113,11 +236,12 @@ class BboxCoordinatesPicker:
         self.resize_job = self.root.after(300, self.fit_image_to_canvas)
 
     def fit_image_to_canvas(self):
-        if not self.original_image: return
+        if not self.pyramid: return
+        self.frames.cancel()
         
         canvas_width = self.canvas.winfo_width()
         canvas_height = self.canvas.winfo_height()
-        img_width, img_height = self.original_image.size
+        img_width, img_height = self.pyramid.size
 
         if img_width > 0 and img_height > 0 and canvas_width > 1 and canvas_height > 1:
             width_ratio = canvas_width / img_width
@@ -134,103 +258,336 @@ class BboxCoordinatesPicker:
         file_path = filedialog.askopenfilename(filetypes=[("Image Files", "*.jpg *.jpeg *.png *.bmp *.gif")])
         if file_path:
             try:
-                self.image_path = file_path
-                self.original_image = Image.open(file_path)
-                self.reset_view()
-                self.fit_image_to_canvas()
-                self.update_status("Image loaded. Ready to annotate.")
-            except (Image.UnidentifiedImageError, IOError) as e:
-                messagebox.showerror("Error", f"Cannot identify image file: {e}")
-
-    def display_image(self):
-        if not self.original_image: return
-        self.canvas.delete("all")
-        img_w, img_h = self.original_image.size
-        scaled_w, scaled_h = int(img_w * self.zoom_level), int(img_h * self.zoom_level)
-        
-        # Only resize if scaled dimensions are > 0
-        if scaled_w > 0 and scaled_h > 0:
-            self.resized_image = self.original_image.resize((scaled_w, scaled_h), Image.Resampling.LANCZOS)
-            self.tk_image = ImageTk.PhotoImage(self.resized_image)
-            self.canvas.create_image(self.canvas_x, self.canvas_y, anchor="nw", image=self.tk_image, tags="image")
-        
-        self.redraw_annotations()
+                self.load_image(file_path)
+            except (OSError, ValueError, KeyError, Image.DecompressionBombError) as e:
+                messagebox.showerror("Error", f"Cannot open {os.path.basename(file_path)}: {e}")
+
+    def load_image(self, file_path):
+        """Open a single image outside any folder. Raises OSError, ValueError, KeyError or DecompressionBombError, leaving the current image as it was, if it cannot be read."""
+        reopened = file_path == self.image_path
+        # Reopening the current image: snapshot it first, so its annotations read back with every edit
+        if reopened: self.close_journal()
+        self.finish_journal(file_path)
+        try:
+            pyramid = LazyPyramid(file_path, self.memory_budget)
+            # Autosaved annotations from an earlier visit, if any
+            ann_path = annotation_path(file_path)
+            store = read_annotation_file(ann_path)[0] if os.path.exists(ann_path) else AnnotationStore()
+            journal, recovered = self.open_journal(file_path, store, pyramid.size)
+        except (OSError, ValueError, KeyError, Image.DecompressionBombError):
+            if reopened: self.start_journal(self.open_journal(self.image_path, self.annotations, self.pyramid.size)[0])
+            raise
+        self.close_journal()
+        self.close_session()
+        self.image_path = file_path
+        self.pyramid = pyramid
+        self.renderer.set_pyramid(pyramid)
+        self.reset_view()
+        self.start_journal(journal)
+        self.set_annotations(store)
+        self.fit_image_to_canvas()
+        self.prepare_wand()
+        self.update_status(f"Image loaded. Recovered {recovered} unsaved edit(s)." if recovered else "Image loaded. Ready to annotate.")
+
+    def open_folder(self):
+        directory = filedialog.askdirectory()
+        if not directory: return
+        self.close_journal()
+        self.close_session()
+        session = DatasetSession(directory, fit_size=(self.canvas.winfo_width(), self.canvas.winfo_height()), memory_budget=self.memory_budget)
+        if not len(session):
+            session.close()
+            messagebox.showinfo("Info", "No images found in this folder.")
+            return
+        self.session = session
+        if self.thumbnails is None: self.thumbnails = ThumbnailCache()
+        self.filmstrip = Filmstrip(self.main_frame, self.thumbnails, session.paths, session.annotation_count, on_select=self.go_to_image, relief="sunken", borderwidth=1)
+        self.filmstrip.pack(side="right", fill="y", padx=5, pady=5, before=self.canvas_frame)
+        # The previous image is closed; until the first one shows, there is none
+        self.image_path = self.pyramid = None
+        self.renderer.set_pyramid(None)
+        self.reset_view()
+        self.show_session_image(0)
+
+    def close_session(self):
+        if self.session:
+            self.close_journal()
+            self.session.close()
+            self.filmstrip.destroy()
+            self.filmstrip = None
+            self.session = None
+            self.prev_button.config(state="disabled")
+            self.next_button.config(state="disabled")
+            self.position_label.config(text="")
+
+    def next_image(self, event=None):
+        if self.session and self.session.position + 1 < len(self.session):
+            self.show_session_image(self.session.position + 1)
+
+    def previous_image(self, event=None):
+        if self.session and self.session.position > 0:
+            self.show_session_image(self.session.position - 1)
+
+    def go_to_image(self, position):
+        if self.session and position != self.session.position:
+            self.show_session_image(position)
+
+    def leave_session_image(self):
+        self.close_journal()
+        self.session.release(self.image_path)
+
+    # --- Autosave ---
+    def open_journal(self, path, store, image_size):
+        """Recover edits a crash left in an image's journal onto store and open a journal for it. Returns (journal, edits recovered).
+
+        A journal that cannot be written only disables autosave; one that cannot be parsed raises ValueError or KeyError.
+        """
+        try:
+            return EditJournal.open(path, store, image_size)
+        except OSError as e:
+            messagebox.showwarning("Autosave disabled", f"Cannot write next to the image, edits will not be autosaved: {e}")
+            return None, 0
+
+    def start_journal(self, journal):
+        """Journal every edit of the current image from now on."""
+        self.journal = journal
+        if journal: self.journal_job = self.root.after(JOURNAL_CHECK_INTERVAL, self.check_journal)
+
+    def check_journal(self):
+        # The journal writes on its own thread; failures are picked up here and shown once each
+        self.journal_job = self.root.after(JOURNAL_CHECK_INTERVAL, self.check_journal)
+        error = self.journal.error
+        if error and error is not self.journal_error:
+            self.update_status(f"Autosave failed, edits will be retried: {error}")
+        self.journal_error = error
+
+    def close_journal(self):
+        """Stop journaling the current image. Its final snapshot is written in the background, so leaving an image never waits for the disk."""
+        if not self.journal: return
+        if self.journal_job: self.root.after_cancel(self.journal_job)
+        self.journal_job = self.journal_error = None
+        journal, self.journal = self.journal, None
+        journal.close(self.annotations)
+        if not journal.done:
+            self.closing[journal.image_path] = journal
+            if not self.closing_job: self.closing_job = self.root.after(JOURNAL_CHECK_INTERVAL, self.check_closing)
+        # A snapshot that fails keeps its journal, which the next open replays
+        if self.session: self.session.mark_saved(self.image_path, self.pyramid.size)
+
+    def check_closing(self):
+        self.closing_job = None
+        for path, journal in list(self.closing.items()):
+            if journal.done: self.finish_journal(path)
+        if self.closing: self.closing_job = self.root.after(JOURNAL_CHECK_INTERVAL, self.check_closing)
+
+    def finish_journal(self, path):
+        """Wait for the final snapshot of an image whose journal was closed, and warn if it could not be written."""
+        journal = self.closing.pop(path, None)
+        if not journal: return
+        try:
+            journal.wait()
+        except OSError as e:
+            messagebox.showwarning("Autosave failed", f"Cannot save the annotations next to {os.path.basename(path)}: {e}\nThe edits are kept in {journal.path} and will be recovered when the image is opened again.")
+
+    def show_session_image(self, position):
+        """Switch to the folder's image at position. If it or its annotations cannot be read, the current image stays as it was."""
+        path = self.session.paths[position]
+        store = None
+        self.finish_journal(path) # back before the last visit's snapshot landed
+        try:
+            pyramid = self.session.pyramid(path)
+            store = self.session.store(path)
+            journal, recovered = self.open_journal(path, store, pyramid.size)
+        except (OSError, ValueError, KeyError, Image.DecompressionBombError) as e:
+            # A journal that failed halfway through its replay left the store half-updated
+            if store is not None: self.session.forget(path)
+            self.filmstrip.set_selection({self.session.position}) # a click already highlighted the row
+            messagebox.showerror("Error", f"Cannot open {os.path.basename(path)}: {e}")
+            return
+        if self.image_path: self.leave_session_image()
+        self.session.go_to(position)
+        self.image_path = path
+        self.pyramid = pyramid
+        self.renderer.set_pyramid(pyramid)
+        self.reset_view()
+        self.start_journal(journal)
+        self.set_annotations(store)
+        self.fit_image_to_canvas()
+        self.prepare_wand()
+        position = self.session.position
+        self.prev_button.config(state="normal" if position > 0 else "disabled")
+        self.next_button.config(state="normal" if position + 1 < len(self.session) else "disabled")
+        self.position_label.config(text=f"{position + 1} / {len(self.session)}")
+        self.filmstrip.set_selection({position})
+        self.filmstrip.see(position)
+        self.update_status(f"{os.path.basename(path)} loaded. " + (f"Recovered {recovered} unsaved edit(s)." if recovered else "Ready to annotate."))
+
+    def on_close(self):
+        self.close_journal()
+        self.close_session()
+        for path in list(self.closing): self.finish_journal(path)
+        if self.wand: self.wand.close()
+        if self.thumbnails: self.thumbnails.close()
+        self.root.destroy()
+
+    def display_image(self, preview=False):
+        if not self.pyramid: return
+        # Only the tiles crossing the canvas are resampled; pans reuse existing tiles
+        self.renderer.render(self.zoom_level, self.canvas_x, self.canvas_y, self.preview_resample if preview else self.final_resample)
+        if preview: self.schedule_refine()
+        self.layer.set_view(self.zoom_level, self.canvas_x, self.canvas_y)
+
+    def schedule_refine(self):
+        if self.refine_job:
+            self.root.after_cancel(self.refine_job)
+        self.refine_job = self.root.after(self.refine_delay, self.refine_image)
+
+    def refine_image(self):
+        self.refine_job = None
+        self.renderer.refine(self.final_resample)
 
     def reset_view(self):
         self.canvas_x, self.canvas_y = 0, 0
         self.zoom_level = 1.0
-        self.annotations = []
-        self.selected_annotation_index = -1
-        self.annotation_listbox.delete(0, tk.END)
+        self.set_annotations(AnnotationStore())
         self.cancel_drawing()
 
+    def set_annotations(self, store):
+        """Make store the current image's annotations and rebuild everything derived from it.
+
+        The layer is left empty; the next display_image() or redraw_annotations() draws it.
+        """
+        self.annotations = store
+        self.layer.store = store
+        self.selected_ids = set()
+        self.layer.clear()
+        self.spatial_index.clear()
+        self.spatial_index.insert_many(store.ids.tolist(), store.bboxes().tolist())
+        self.label_index.rebuild(store)
+        self.label_filter = None
+        self.update_annotation_list()
+        self.annotation_list.set_selection(())
+
+    # --- Annotation list ---
+    def annotation_row_text(self, ann_id):
+        i = self.annotations.index_of(ann_id)
+        return f"{self.annotations.label(i)}: {self.annotations.type_name(i)}"
+
+    def update_annotation_list(self):
+        """Refresh the list rows for the current filter, and the filter menu's counts."""
+        if self.label_filter is not None and not self.label_index.count(self.label_filter):
+            self.label_filter = None
+        if self.label_filter is None:
+            self.annotation_list.set_rows(self.annotations.ids.copy())
+        else:
+            self.annotation_list.set_rows(self.label_index.ids_of(self.label_filter))
+
+        counts = self.label_index.counts()
+        menu = self.filter_menu["menu"]
+        menu.delete(0, "end")
+        menu.add_command(label=f"All labels ({len(self.annotations)})", command=lambda: self.set_label_filter(None))
+        for label, count in counts.items():
+            menu.add_command(label=f"{label} ({count})", command=lambda label=label: self.set_label_filter(label))
+        if self.label_filter is None:
+            self.filter_text.set(f"All labels ({len(self.annotations)})")
+        else:
+            self.filter_text.set(f"{self.label_filter} ({counts[self.label_filter]})")
+        if self.filmstrip: self.filmstrip.update_badge(self.session.position) # annotation count of the current image
+
+    def set_label_filter(self, label):
+        self.label_filter = label
+        self.update_annotation_list()
+
     def redraw_annotations(self):
-        for i, ann in enumerate(self.annotations):
-            points = ann["points"]
-            color = "cyan" if i == self.selected_annotation_index else "red"
-            if ann["type"] == "BBox":
-                x1, y1, x2, y2 = points[0][0], points[0][1], points[1][0], points[1][1]
-                cx1, cy1 = self.img_to_canvas(x1, y1)
-                cx2, cy2 = self.img_to_canvas(x2, y2)
-                self.canvas.create_rectangle(cx1, cy1, cx2, cy2, outline=color, width=2, tags=f"ann_{i}")
-                self.canvas.create_text(cx1, cy1 - 10, text=ann["label"], fill="white", anchor="sw", tags=f"label_{i}")
-            elif ann["type"] == "Polygon":
-                canvas_points = [self.img_to_canvas(p[0], p[1]) for p in points]
-                if len(canvas_points) > 1:
-                    self.canvas.create_polygon(canvas_points, outline=color, fill="", width=2, tags=f"ann_{i}")
-                    self.canvas.create_text(canvas_points[0][0], canvas_points[0][1] - 10, text=ann["label"], fill="white", anchor="sw", tags=f"label_{i}")
+        # Full rebuild; incremental edits go through add/remove/set_selected on the layer
+        self.layer.clear()
+        self.layer.set_selected(self.selected_ids)
+        self.layer.set_view(self.zoom_level, self.canvas_x, self.canvas_y)
+
+    def annotation_index(self, ann_id):
+        return self.annotations.index_of(ann_id)
+
+    def hit_test(self, x, y, interior=True):
+        """Id of the smallest annotation under canvas point (x, y), or None."""
+        ix, iy = self.canvas_to_img(x, y)
+        return self.spatial_index.hit_test(ix, iy, self.annotations, HIT_TOLERANCE / self.zoom_level, interior)
 
     def on_button_press(self, event):
-        clicked_item_ids = self.canvas.find_withtag(tk.CURRENT)
-        if clicked_item_ids:
-            item_id = clicked_item_ids[0]
-            item_tags = self.canvas.gettags(item_id)
-            ann_tags = [tag for tag in item_tags if tag.startswith("ann_")]
-            if ann_tags:
-                ann_index = int(ann_tags[0].split("_")[1])
-                self.select_annotation(ann_index)
-                return
+        if event.state & 0x0001 and not self.drawing: # Shift: rubber-band selection
+            self.band_start = (event.x, event.y)
+            self.band_rect_id = self.canvas.create_rectangle(event.x, event.y, event.x, event.y, outline="cyan", dash=(4, 2))
+            return
 
         if self.draw_mode.get() == "BBox":
             self.drawing = True
             self.start_x, self.start_y = event.x, event.y
             self.current_rect_id = self.canvas.create_rectangle(self.start_x, self.start_y, self.start_x, self.start_y, outline='red', width=2)
         elif self.draw_mode.get() == "Polygon":
+            if not self.drawing:
+                # Outside of a drawing, a click on an outline selects instead of starting a polygon
+                ann_id = self.hit_test(event.x, event.y, interior=False)
+                if ann_id is not None:
+                    self.select_annotation(self.annotation_index(ann_id))
+                    return
             self.drawing = True
             self.current_polygon_points.append((event.x, event.y))
             if len(self.current_polygon_points) == 1:
                 self.update_status("Click to add points. Right-click or press Enter to finish.")
-            if self.current_polygon_id:
-                self.canvas.delete(self.current_polygon_id)
-            self.current_polygon_id = self.canvas.create_polygon(self.current_polygon_points, outline="red", fill="", width=2)
+            self.update_polygon_preview(self.current_polygon_points)
+        elif self.draw_mode.get() == "Wand" and self.wand:
+            ann_id = self.hit_test(event.x, event.y, interior=False)
+            if ann_id is not None:
+                self.select_annotation(self.annotation_index(ann_id))
+                return
+            self.run_wand(*self.canvas_to_img(event.x, event.y))
 
     def on_mouse_drag(self, event):
-        if self.draw_mode.get() == "BBox" and self.drawing:
-            self.canvas.coords(self.current_rect_id, self.start_x, self.start_y, event.x, event.y)
+        if self.band_rect_id or (self.draw_mode.get() == "BBox" and self.drawing):
+            self.frames.set_drag(event.x, event.y)
 
     def on_button_release(self, event):
-        if self.draw_mode.get() == "BBox" and self.drawing:
+        self.frames.flush()
+        if self.band_rect_id:
+            self.finish_band_selection(event)
+        elif self.draw_mode.get() == "BBox" and self.drawing:
             self.drawing = False
             x1_c, y1_c = self.start_x, self.start_y
             x2_c, y2_c = event.x, event.y
             x1, y1 = self.canvas_to_img(x1_c, y1_c)
             x2, y2 = self.canvas_to_img(x2_c, y2_c)
+            self.canvas.delete(self.current_rect_id)
+            self.current_rect_id = None
             if abs(x1 - x2) < 1 or abs(y1 - y2) < 1:
-                self.canvas.delete(self.current_rect_id)
+                # A click without a drag selects the smallest annotation under the cursor
+                ann_id = self.hit_test(x1_c, y1_c)
+                if ann_id is not None: self.select_annotation(self.annotation_index(ann_id))
             else:
                 points = [(min(x1, x2), min(y1, y2)), (max(x1, x2), max(y1, y2))]
                 self.add_annotation("BBox", points)
-            self.current_rect_id = None
+
+    def finish_band_selection(self, event):
+        x1, y1 = self.canvas_to_img(*self.band_start)
+        x2, y2 = self.canvas_to_img(event.x, event.y)
+        self.canvas.delete(self.band_rect_id)
+        self.band_rect_id, self.band_start = None, None
+        ann_ids = self.spatial_index.query_rect(min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2))
+        self.select_annotations(self.annotations.indices_of(ann_ids).tolist())
 
     def on_mouse_move(self, event):
         if self.draw_mode.get() == "Polygon" and self.drawing and self.current_polygon_points:
-            if self.current_polygon_id:
-                self.canvas.delete(self.current_polygon_id)
-            self.current_polygon_id = self.canvas.create_polygon(self.current_polygon_points + [(event.x, event.y)], outline="red", fill="", width=2)
+            self.frames.set_hover(event.x, event.y)
+
+    def update_polygon_preview(self, points):
+        # One persistent item for the in-progress polygon; later updates only move its vertices
+        coords = [coord for point in points for coord in point]
+        if self.current_polygon_id:
+            self.canvas.coords(self.current_polygon_id, coords)
+        else:
+            self.current_polygon_id = self.canvas.create_polygon(coords, outline="red", fill="", width=2)
 
     def finish_polygon(self, event=None):
         if self.draw_mode.get() == "Polygon" and self.drawing and len(self.current_polygon_points) >= 3:
-            img_points = [self.canvas_to_img(p[0], p[1]) for p in self.current_polygon_points]
+            img_points = np.trunc(canvas_to_image(self.current_polygon_points, self.zoom_level, self.canvas_x, self.canvas_y))
             self.add_annotation("Polygon", img_points)
         self.cancel_drawing()
         return "break"
@@ -239,67 +596,160 @@ class BboxCoordinatesPicker:
         self.drawing = False
         if self.current_rect_id: self.canvas.delete(self.current_rect_id)
         if self.current_polygon_id: self.canvas.delete(self.current_polygon_id)
+        if self.band_rect_id: self.canvas.delete(self.band_rect_id)
+        self.band_rect_id, self.band_start = None, None
         self.current_rect_id = None
         self.current_polygon_id = None
         self.current_polygon_points = []
         self.update_status("Ready.")
 
+    # --- Magic wand ---
+    def on_wand_mode(self):
+        self.cancel_drawing()
+        self.prepare_wand()
+        self.update_status("Click a region to outline it as a polygon.")
+
+    def prepare_wand(self):
+        """Start decoding the wand's working copy of the current image, dropping the previous image's."""
+        if self.wand and self.wand.image_path == self.image_path: return
+        if self.wand:
+            self.wand.close()
+            self.wand = None
+        if self.pyramid and self.draw_mode.get() == "Wand":
+            self.wand = MagicWand(self.image_path, self.pyramid.size)
+
+    def run_wand(self, x, y):
+        try:
+            tolerance = self.wand_tolerance.get()
+        except tk.TclError:
+            tolerance = DEFAULT_TOLERANCE
+        self.update_status("Finding region...")
+        self.poll_wand(self.wand, self.wand.select(x, y, tolerance))
+
+    def poll_wand(self, wand, future):
+        # The region grows on the wand's thread; the UI only checks back until it is done
+        if wand is not self.wand: return # the image changed in the meantime
+        if not future.done():
+            self.root.after(WAND_POLL_INTERVAL, self.poll_wand, wand, future)
+            return
+        try:
+            points = future.result()
+        except OSError as e:
+            self.update_status(f"Magic wand failed: {e}")
+            return
+        if points is None:
+            self.update_status("No region found at that point.")
+            return
+        self.add_annotation("Polygon", np.trunc(points))
+        self.update_status(f"Added a {len(points)}-point polygon.")
+
     def add_annotation(self, ann_type, points):
         label = self.label_text.get()
-        ann_data = {"type": ann_type, "label": label, "points": points}
-        self.annotations.append(ann_data)
-        self.annotation_listbox.insert(tk.END, f"{label}: {ann_type}")
+        ann_id = self.annotations.append(ann_type, label, points)
+        self.spatial_index.insert(ann_id, self.annotations.bbox(len(self.annotations) - 1))
+        self.layer.add(ann_id)
+        if self.journal: self.journal.log_add(self.annotations, len(self.annotations) - 1)
+        self.label_index.insert(ann_id, label)
+        self.update_annotation_list()
         self.select_annotation(len(self.annotations) - 1)
 
     def select_annotation(self, index):
-        if 0 <= index < len(self.annotations):
-            self.selected_annotation_index = index
-            self.annotation_listbox.selection_clear(0, tk.END)
-            self.annotation_listbox.selection_set(index)
-            self.annotation_listbox.activate(index)
-            self.display_image()
-            self.update_status(f"Selected annotation {index+1}")
-
-    def on_annotation_select(self, event):
-        selected_indices = self.annotation_listbox.curselection()
-        if selected_indices: self.select_annotation(selected_indices[0])
+        self.select_annotations([index])
+
+    def select_annotations(self, indices):
+        indices = sorted(i for i in indices if 0 <= i < len(self.annotations))
+        self.selected_ids = {int(self.annotations.ids[i]) for i in indices}
+        self.annotation_list.set_selection(self.selected_ids)
+        if indices:
+            self.annotation_list.see(int(self.annotations.ids[indices[-1]]))
+        self.layer.set_selected(self.selected_ids)
+        if len(indices) == 1:
+            self.update_status(f"Selected annotation {indices[0]+1}")
+        elif indices:
+            self.update_status(f"Selected {len(indices)} annotations")
+
+    def on_annotation_select(self, ann_ids):
+        if ann_ids: self.select_annotations(self.annotations.indices_of(ann_ids).tolist())
+
+    def on_delete_key(self, event):
+        if isinstance(event.widget, (tk.Entry, tk.Spinbox)): return # the key edits the label or the tolerance there
+        self.delete_selected_annotation()
 
     def delete_selected_annotation(self, event=None):
-        if self.selected_annotation_index != -1:
-            self.annotations.pop(self.selected_annotation_index)
-            self.annotation_listbox.delete(self.selected_annotation_index)
-            self.selected_annotation_index = -1
-            self.display_image()
-            self.update_status("Annotation deleted.")
+        if self.selected_ids:
+            indices = np.sort(self.annotations.indices_of(self.selected_ids))
+            for ann_id, i in zip(self.annotations.ids[indices].tolist(), indices.tolist()):
+                self.spatial_index.remove(ann_id)
+                self.layer.remove(ann_id)
+                self.label_index.remove(ann_id, self.annotations.label(i))
+            self.annotations.delete(indices)
+            if self.journal: self.journal.log_delete(self.annotations, self.selected_ids)
+            self.update_annotation_list()
+            self.annotation_list.set_selection(())
+            self.update_status(f"{len(self.selected_ids)} annotation(s) deleted." if len(self.selected_ids) > 1 else "Annotation deleted.")
+            self.selected_ids = set()
+
+    def relabel_selected(self):
+        """Give every selected annotation the label in the label entry."""
+        label = self.label_text.get()
+        if not self.selected_ids or not label: return
+        indices = self.annotations.indices_of(self.selected_ids)
+        for ann_id, i in zip(self.annotations.ids[indices].tolist(), indices.tolist()):
+            self.label_index.relabel(ann_id, self.annotations.label(i), label)
+        self.annotations.set_label(indices, label)
+        if self.journal: self.journal.log_relabel(self.annotations, self.selected_ids, label)
+        for ann_id in self.selected_ids:
+            self.layer.update_label(ann_id)
+        self.update_annotation_list()
+        self.update_status(f"Relabeled {len(self.selected_ids)} annotation(s) as '{label}'.")
+
+    def on_nudge(self, event, dx, dy):
+        if isinstance(event.widget, (tk.Entry, tk.Spinbox)): return # arrow keys edit the label or the tolerance there
+        step = 10 if event.state & 0x0001 else 1 # Shift moves faster
+        self.nudge_selected(dx * step, dy * step)
+
+    def nudge_selected(self, dx, dy):
+        """Move the selected annotations by (dx, dy) image pixels."""
+        if not self.selected_ids: return
+        ann_ids = list(self.selected_ids)
+        indices = self.annotations.indices_of(ann_ids).tolist()
+        for ann_id, i in zip(ann_ids, indices):
+            self.annotations.translate(i, dx, dy)
+            self.spatial_index.insert(ann_id, self.annotations.bbox(i))
+            self.layer.remove(ann_id)
+            self.layer.add(ann_id)
+        self.layer.set_selected(self.selected_ids)
+        if self.journal: self.journal.log_move(self.annotations, indices)
 
     def on_pan_start(self, event): self.pan_start_x, self.pan_start_y = event.x, event.y
     def on_pan_move(self, event):
         dx, dy = event.x - self.pan_start_x, event.y - self.pan_start_y
-        self.canvas_x += dx
-        self.canvas_y += dy
         self.pan_start_x, self.pan_start_y = event.x, event.y
-        self.display_image()
+        self.frames.pan(dx, dy)
 
     def on_zoom(self, event):
         factor = 1.1 if event.delta > 0 else 0.9
-        cx, cy = event.x, event.y
-        ix, iy = self.canvas_to_img(cx, cy, zoom_independent=True)
-        self.zoom_level *= factor
-        self.canvas_x = cx - ix * self.zoom_level
-        self.canvas_y = cy - iy * self.zoom_level
-        self.display_image()
-
-    def canvas_to_img(self, x, y, zoom_independent=False):
-        zoom = 1.0 if zoom_independent else self.zoom_level
-        img_x = (x - self.canvas_x) / zoom
-        img_y = (y - self.canvas_y) / zoom
+        self.frames.zoom(factor, event.x, event.y)
+
+    def render_frame(self, scale, shift_x, shift_y, drag, hover):
+        if scale != 1.0 or shift_x or shift_y:
+            self.zoom_level *= scale
+            self.canvas_x = self.canvas_x * scale + shift_x
+            self.canvas_y = self.canvas_y * scale + shift_y
+            self.display_image(preview=True)
+        if drag:
+            if self.band_rect_id:
+                self.canvas.coords(self.band_rect_id, self.band_start[0], self.band_start[1], *drag)
+            elif self.current_rect_id:
+                self.canvas.coords(self.current_rect_id, self.start_x, self.start_y, *drag)
+        if hover and self.drawing and self.current_polygon_points:
+            self.update_polygon_preview(self.current_polygon_points + [hover])
+
+    def canvas_to_img(self, x, y):
+        img_x = (x - self.canvas_x) / self.zoom_level
+        img_y = (y - self.canvas_y) / self.zoom_level
         return int(img_x), int(img_y)
 
-    def img_to_canvas(self, x, y):
-        can_x = self.canvas_x + x * self.zoom_level
-        can_y = self.canvas_y + y * self.zoom_level
-        return can_x, can_y
-
     def update_status(self, text):
         self.coordinates_label.config(text=f"Status: {text}")
 
@@ -315,8 +765,35 @@ class BboxCoordinatesPicker:
             initialfile=os.path.splitext(os.path.basename(self.image_path))[0])
         if file_path:
             ext = os.path.splitext(file_path)[1].lower()
-            fmt = {".py": "python_dict", ".json": "coco", ".xml": "pascal_voc", ".txt": "yolo"}.get(ext)
+            fmt = {extension: name for name, extension in FORMAT_EXTENSIONS.items()}.get(ext)
             if not fmt: messagebox.showerror("Error", "Unsupported format."); return
-            class_list = sorted(list(set(ann['label'] for ann in self.annotations)))
-            save_annotations(fmt, file_path, self.annotations, self.image_path, self.original_image.size, class_list)
-            messagebox.showinfo("Success", f"Annotations saved to {file_path}")
\ No newline at end of file
+            class_list = self.annotations.used_labels()
+            save_annotations(fmt, file_path, self.annotations, self.image_path, self.pyramid.size, class_list)
+            messagebox.showinfo("Success", f"Annotations saved to {file_path}")
+
+    def import_annotation_dialog(self):
+        if not self.pyramid: messagebox.showinfo("Info", "Load an image first."); return
+        file_path = filedialog.askopenfilename(
+            filetypes=[
+                ("Annotation Files", "*.json *.xml *.txt *.py"),
+                ("COCO JSON", "*.json"),
+                ("PASCAL VOC XML", "*.xml"),
+                ("YOLO TXT", "*.txt"),
+                ("Python Dict", "*.py")
+            ])
+        if not file_path: return
+        ext = os.path.splitext(file_path)[1].lower()
+        fmt = {extension: name for name, extension in FORMAT_EXTENSIONS.items()}.get(ext)
+        if not fmt: messagebox.showerror("Error", "Unsupported format."); return
+        if len(self.annotations) and not messagebox.askyesno("Import", "Replace the current annotations with the imported ones?"): return
+        try:
+            store = load_annotations(fmt, file_path, self.image_path, self.pyramid.size)
+        except (OSError, ValueError, KeyError, SyntaxError, AttributeError, TypeError) as e:
+            # Malformed VOC and Python dict files fail on missing elements or unexpected shapes
+            messagebox.showerror("Error", f"Cannot read annotations: {e}")
+            return
+        if self.session: self.session.replace_store(self.image_path, store)
+        if self.journal: self.journal.compact(store)
+        self.set_annotations(store)
+        self.redraw_annotations()
+        self.update_status(f"Imported {len(store)} annotation(s) from {os.path.basename(file_path)}.")
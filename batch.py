@@ -0,0 +1,142 @@
+import argparse
+import os
+import sys
+import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+from PIL import Image
+from dataset import ANNOTATION_SUFFIX, atomic_write, read_annotation_file
+from utils import save_annotations, CocoDatasetWriter, FORMAT_EXTENSIONS
+
+PROGRESS_INTERVAL = 1.0 # seconds between progress lines
+
+def find_annotation_files(directory):
+    """Every annotation file under directory, sorted, with the image it belongs to."""
+    found = []
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            if name.endswith(ANNOTATION_SUFFIX):
+                path = os.path.join(root, name)
+                found.append((path, path[:-len(ANNOTATION_SUFFIX)]))
+    return found
+
+def read_classes(path):
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip()]
+
+# --- Worker side ---
+def collect_labels(task):
+    ann_path, image_path = task
+    try:
+        return read_annotation_file(ann_path)[0].used_labels()
+    except Exception:
+        return [] # reported by export_file
+
+def export_file(task):
+    """Convert one annotation file to every requested format.
+
+    Returns (annotation count, error or None, (store, image_path, size) when keep_store is set).
+    """
+    ann_path, image_path, output_base, formats, class_list, keep_store = task
+    try:
+        store, size = read_annotation_file(ann_path)
+        if size is None:
+            # Older files do not record the size; the image header has it
+            with Image.open(image_path) as image:
+                size = image.size
+        if formats: os.makedirs(os.path.dirname(output_base) or ".", exist_ok=True)
+        for fmt in formats:
+            save_annotations(fmt, output_base + FORMAT_EXTENSIONS[fmt], store, image_path, size, class_list)
+        return len(store), None, (store, image_path, size) if keep_store else None
+    except Exception as e:
+        return 0, f"{ann_path}: {e}", None
+
+def _run_chunk(fn, items):
+    return [fn(item) for item in items]
+
+# --- Driver ---
+def bounded_map(executor, fn, items, chunksize, window):
+    """executor.map(fn, items, chunksize=chunksize) in order, with at most window chunks submitted ahead of the consumer.
+
+    executor.map submits everything up front, so when workers outpace the
+    loop consuming their results (the COCO dataset writer) finished
+    results pile up in this process; here they cannot exceed window chunks.
+    """
+    pending = deque()
+    for i in range(0, len(items), chunksize):
+        pending.append(executor.submit(_run_chunk, fn, items[i:i + chunksize]))
+        if len(pending) >= window:
+            yield from pending.popleft().result()
+    while pending:
+        yield from pending.popleft().result()
+
+def run(directory, output, formats, class_list=None, jobs=None, chunksize=16, coco_dataset=None, out=sys.stderr):
+    """Export every annotation file under directory in parallel and return a summary dict.
+
+    With coco_dataset, every image is also merged into that single COCO file as its result arrives.
+    """
+    files = find_annotation_files(directory)
+    start = time.perf_counter()
+    done = annotations = 0
+    errors = []
+    last_report = start
+    window = 2 * (jobs or os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        if class_list is None:
+            # One class list for the whole dataset, so class ids agree between images
+            labels = set()
+            for used in bounded_map(executor, collect_labels, files, chunksize, window):
+                labels.update(used)
+            class_list = sorted(labels)
+
+        tasks = []
+        bases = [os.path.join(output, os.path.splitext(os.path.relpath(image_path, directory))[0]) for _, image_path in files]
+        uses = Counter(bases)
+        for (ann_path, image_path), output_base in zip(files, bases):
+            if formats and uses[output_base] > 1:
+                # a.jpg and a.png would overwrite each other's exports; still merged into the COCO dataset
+                errors.append(f"{ann_path}: {uses[output_base]} images export to {output_base}.*, skipping its per-image files")
+                tasks.append((ann_path, image_path, output_base, (), class_list, coco_dataset is not None))
+            else:
+                tasks.append((ann_path, image_path, output_base, formats, class_list, coco_dataset is not None))
+        with ExitStack() as stack:
+            writer = stack.enter_context(CocoDatasetWriter(coco_dataset, class_list)) if coco_dataset else None
+            for count, error, payload in bounded_map(executor, export_file, tasks, chunksize, window):
+                if payload: writer.add(*payload)
+                done += 1
+                annotations += count
+                if error: errors.append(error)
+                now = time.perf_counter()
+                if now - last_report >= PROGRESS_INTERVAL:
+                    last_report = now
+                    print(f"{done}/{len(tasks)} files, {done / (now - start):.0f} files/s", file=out)
+
+    if "yolo" in formats and tasks:
+        os.makedirs(output, exist_ok=True)
+        atomic_write(os.path.join(output, "classes.txt"), "\n".join(class_list))
+    elapsed = time.perf_counter() - start
+    return {"files": len(tasks), "annotations": annotations, "errors": errors, "classes": len(class_list), "seconds": elapsed}
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Export stored annotations for a directory tree without the GUI")
+    parser.add_argument("directory", help="Directory searched recursively for *.ann.json files")
+    parser.add_argument("-f", "--formats", nargs="*", choices=FORMAT_EXTENSIONS, default=["coco"], help="Per-image formats to write (pass no names for none)")
+    parser.add_argument("--coco-dataset", help="Also write the whole dataset as one COCO file at this path")
+    parser.add_argument("-o", "--output", help="Output directory, mirroring the input tree (default: next to the images)")
+    parser.add_argument("-c", "--classes", help="File with one class name per line, fixing class ids (default: every label found, sorted)")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="Worker processes (default: one per CPU)")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    summary = run(args.directory, args.output or args.directory, args.formats, read_classes(args.classes) if args.classes else None, args.jobs, coco_dataset=args.coco_dataset)
+    for error in summary["errors"]:
+        print(f"error: {error}", file=sys.stderr)
+    seconds = max(summary["seconds"], 1e-9)
+    print(f"Exported {summary['files'] - len(summary['errors'])}/{summary['files']} files "
+          f"({summary['annotations']} annotations, {summary['classes']} classes) "
+          f"as {', '.join(args.formats + (['COCO dataset'] if args.coco_dataset else []))} in {summary['seconds']:.2f}s: "
+          f"{summary['files'] / seconds:.0f} files/s, {summary['annotations'] / seconds:.0f} annotations/s")
+    sys.exit(1 if summary["errors"] else 0)
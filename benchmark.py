@@ -0,0 +1,327 @@
+import argparse
+import json
+import math
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import numpy as np
+import PIL
+from PIL import Image, ImageTk
+from loader import LazyPyramid, DEFAULT_MEMORY_BUDGET
+from render import TiledCanvasRenderer
+from scene import AnnotationLayer
+from spatial import GridIndex
+from store import AnnotationStore, canvas_to_image
+from utils import save_annotations, FORMAT_EXTENSIONS
+
+IMAGE_SIZES = (1, 12, 50, 200) # megapixels
+ANNOTATION_COUNTS = (10, 1000, 100_000)
+IMAGE_WIDTH, IMAGE_HEIGHT = 4000, 3000 # coordinate space of the synthetic annotations
+VIEWPORT = (1200, 800)
+CLASSES = [f"class_{i}" for i in range(10)]
+HIT_TESTS = 1000 # points per hit-test run
+PAN_STEP = 64 # canvas pixels per simulated pan
+THRESHOLD = 0.15 # relative slowdown flagged by --compare
+NOISE_FLOOR = 0.1 # ms; smaller differences are never flagged
+
+# --- Synthetic inputs ---
+def synthetic_image(work_dir, megapixels, seed=0):
+    """Path of a 4:3 JPEG of about megapixels million pixels, made once per work_dir.
+
+    Smooth color blobs with fine noise on top, so it compresses and resamples
+    like a photo rather than a flat test card.
+    """
+    path = os.path.join(work_dir, f"synthetic-{megapixels}mp.jpg")
+    if os.path.exists(path): return path
+    width = int(round(math.sqrt(megapixels * 1e6 * 4 / 3)))
+    height = width * 3 // 4
+    rng = np.random.default_rng(seed)
+    blobs = Image.fromarray(rng.integers(0, 256, (max(2, height // 64), max(2, width // 64), 3), dtype=np.uint8))
+    image = blobs.resize((width, height), Image.Resampling.BICUBIC)
+    noise = Image.fromarray(rng.integers(0, 256, (256, 256), dtype=np.uint8)).convert("RGB")
+    for y in range(0, height, 256):
+        for x in range(0, width, 256):
+            box = (x, y, min(width, x + 256), min(height, y + 256))
+            tile = image.crop(box)
+            image.paste(Image.blend(tile, noise.crop((0, 0, tile.width, tile.height)), 0.1), box)
+    os.makedirs(work_dir, exist_ok=True)
+    image.save(path, "JPEG", quality=90)
+    return path
+
+def synthetic_store(count, seed=0):
+    """count annotations over a 4000 x 3000 image, half boxes and half 8-32 vertex polygons, in 10 classes."""
+    rng = np.random.default_rng(seed)
+    store = AnnotationStore()
+    centers = rng.uniform((0, 0), (IMAGE_WIDTH, IMAGE_HEIGHT), (count, 2))
+    radii = rng.lognormal(3.5, 0.7, count).clip(2, 600)
+    vertices = rng.integers(8, 33, count)
+    labels = rng.integers(0, len(CLASSES), count)
+    for i in range(count):
+        cx, cy = centers[i]
+        r = radii[i]
+        if i % 2 == 0:
+            points = [(max(0, cx - r), max(0, cy - r * 0.75)), (min(IMAGE_WIDTH, cx + r), min(IMAGE_HEIGHT, cy + r * 0.75))]
+        else:
+            angles = np.sort(rng.uniform(0, 2 * math.pi, vertices[i]))
+            lengths = r * rng.uniform(0.6, 1.0, vertices[i])
+            points = np.trunc(np.column_stack((cx + lengths * np.cos(angles), cy + lengths * np.sin(angles))).clip(0, (IMAGE_WIDTH, IMAGE_HEIGHT)))
+        store.append("BBox" if i % 2 == 0 else "Polygon", CLASSES[labels[i]], points)
+    return store
+
+class HeadlessCanvas:
+    """The part of tk.Canvas that AnnotationLayer and TiledCanvasRenderer use, keeping items in a dict.
+
+    Used when there is no display, so redraw and render benchmarks measure
+    the layer's and renderer's own work (culling, level of detail, tile
+    reuse, resampling) without Tk's.
+    """
+    def __init__(self, width, height):
+        self.width, self.height = width, height
+        self.items = {} # item id -> [coords, tags]
+        self.next_id = 1
+
+    def winfo_width(self): return self.width
+    def winfo_height(self): return self.height
+
+    def _create(self, coords, tags=(), **options):
+        item_id = self.next_id
+        self.next_id += 1
+        self.items[item_id] = [list(coords), tags]
+        return item_id
+
+    def create_rectangle(self, *coords, **options): return self._create(coords, **options)
+    def create_polygon(self, *coords, **options): return self._create(coords, **options)
+    def create_text(self, *coords, **options): return self._create(coords, **options)
+    def create_image(self, *coords, **options): return self._create(coords, **options)
+
+    def _matching(self, tag_or_id):
+        if isinstance(tag_or_id, int): return [tag_or_id] if tag_or_id in self.items else []
+        return [item_id for item_id, (coords, tags) in self.items.items() if tag_or_id in tags]
+
+    def delete(self, tag_or_id):
+        for item_id in self._matching(tag_or_id):
+            del self.items[item_id]
+
+    def coords(self, item_id, *coords):
+        self.items[item_id][0] = list(coords[0] if len(coords) == 1 else coords)
+
+    def itemconfig(self, item_id, **options):
+        pass
+
+    def tag_lower(self, tag_or_id):
+        pass
+
+    def move(self, tag_or_id, dx, dy):
+        for item_id in self._matching(tag_or_id):
+            coords = self.items[item_id][0]
+            coords[0::2] = [c + dx for c in coords[0::2]]
+            coords[1::2] = [c + dy for c in coords[1::2]]
+
+def headless_photo(tile):
+    """Stand-in for ImageTk.PhotoImage on a HeadlessCanvas: the tile itself."""
+    return tile
+
+def make_canvas(use_tk):
+    """A real Tk canvas of VIEWPORT size when asked for (needs a display, e.g. xvfb-run), else a HeadlessCanvas."""
+    if not use_tk: return HeadlessCanvas(*VIEWPORT), "headless"
+    import tkinter as tk
+    root = tk.Tk()
+    canvas = tk.Canvas(root, width=VIEWPORT[0], height=VIEWPORT[1], highlightthickness=0)
+    canvas.pack()
+    root.update()
+    return canvas, "tk"
+
+# --- Timing ---
+def measure(run, repeat, setup=None):
+    """Run times in ms of run(setup()), after one untimed warm-up run."""
+    times = []
+    for i in range(repeat + 1):
+        state = setup() if setup else None
+        start = time.perf_counter()
+        run(state)
+        elapsed = (time.perf_counter() - start) * 1000
+        if i: times.append(elapsed)
+    return times
+
+def fit_view(size):
+    zoom = min(VIEWPORT[0] / size[0], VIEWPORT[1] / size[1])
+    return zoom, (VIEWPORT[0] - size[0] * zoom) / 2, (VIEWPORT[1] - size[1] * zoom) / 2
+
+# --- Benchmarks ---
+def render_benchmarks(path, megapixels, memory_budget, renderer):
+    """(name, run, setup) for the image paths: opening, fit-to-window, 1:1 zoom and panning, through renderer."""
+    def opened():
+        pyramid = LazyPyramid(path, memory_budget)
+        renderer.set_pyramid(pyramid)
+        return pyramid, fit_view(pyramid.size)
+
+    def warm(zoom_one):
+        pyramid, (zoom, x, y) = opened()
+        if zoom_one: zoom, x, y = 1.0, -(pyramid.size[0] - VIEWPORT[0]) / 2, -(pyramid.size[1] - VIEWPORT[1]) / 2
+        pyramid.level(pyramid.level_for_zoom(zoom)) # decoded once, as while the image is shown
+        return zoom, x, y
+
+    def open_and_fit(state):
+        pyramid, (zoom, x, y) = opened()
+        renderer.render(zoom, x, y, Image.Resampling.LANCZOS)
+
+    def pan(state):
+        # Preview filter while dragging, as the app does; each step moves the kept tiles and renders the new ones
+        zoom, x, y = state
+        renderer.render(zoom, x, y, Image.Resampling.BILINEAR)
+        for step in range(1, 11):
+            renderer.render(zoom, x - step * PAN_STEP, y, Image.Resampling.BILINEAR)
+
+    tag = f"{megapixels}mp"
+    return [
+        (f"render/open/{tag}", open_and_fit, None),
+        (f"render/fit/{tag}", lambda state: renderer.render(*state, Image.Resampling.LANCZOS), lambda: warm(False)),
+        (f"render/zoom_1to1/{tag}", lambda state: renderer.render(*state, Image.Resampling.LANCZOS), lambda: warm(True)),
+        (f"render/pan_10_steps/{tag}", pan, lambda: warm(True)),
+    ]
+
+def annotation_benchmarks(store, count, canvas, out_dir):
+    """(name, run, setup) for indexing, hit-testing, redraw, coordinate transforms and every exporter."""
+    index = GridIndex()
+    index.insert_many(store.ids, store.bboxes())
+    rng = np.random.default_rng(1)
+    points = rng.uniform((0, 0), (IMAGE_WIDTH, IMAGE_HEIGHT), (HIT_TESTS, 2)).tolist()
+    fit_zoom, fit_x, fit_y = fit_view((IMAGE_WIDTH, IMAGE_HEIGHT))
+
+    def build_index(state):
+        GridIndex().insert_many(store.ids, store.bboxes())
+
+    def hit_test(state):
+        for x, y in points:
+            index.hit_test(x, y, store, 4 / fit_zoom)
+
+    def layer(zoom=fit_zoom, x=fit_x, y=fit_y):
+        """A layer looking at (zoom, x, y) on an empty canvas."""
+        new_layer = AnnotationLayer(canvas, store, index)
+        canvas.delete(new_layer.tag)
+        new_layer.set_view(zoom, x, y)
+        return new_layer
+
+    def redraw(layer):
+        layer.rebuild()
+
+    def built(zoom, x, y):
+        built_layer = layer(zoom, x, y)
+        built_layer.rebuild()
+        return built_layer
+
+    def pan(layer):
+        for step in range(1, 11):
+            layer.set_view(layer.zoom, layer.x - PAN_STEP, layer.y)
+
+    def zoom_in(layer):
+        for step in range(10):
+            factor = 1.1
+            layer.set_view(layer.zoom * factor, layer.x * factor + VIEWPORT[0] / 2 * (1 - factor), layer.y * factor + VIEWPORT[1] / 2 * (1 - factor))
+
+    def to_image(state):
+        canvas_to_image(store.to_canvas(fit_zoom, fit_x, fit_y), fit_zoom, fit_x, fit_y)
+
+    def export(fmt):
+        file_path = os.path.join(out_dir, f"export-{count}{FORMAT_EXTENSIONS[fmt]}")
+        return lambda state: save_annotations(fmt, file_path, store, "synthetic.jpg", (IMAGE_WIDTH, IMAGE_HEIGHT), CLASSES)
+
+    tag = f"{count}"
+    benchmarks = [
+        (f"annotations/build_index/{tag}", build_index, None),
+        (f"annotations/hit_test_{HIT_TESTS}/{tag}", hit_test, None),
+        (f"annotations/canvas_to_image/{tag}", to_image, None),
+        (f"annotations/redraw_fit/{tag}", redraw, layer),
+        (f"annotations/redraw_2x/{tag}", redraw, lambda: layer(fit_zoom * 2, fit_x * 2 - VIEWPORT[0] / 2, fit_y * 2 - VIEWPORT[1] / 2)),
+        (f"annotations/pan_10_steps/{tag}", pan, lambda: built(fit_zoom * 2, fit_x * 2 - VIEWPORT[0] / 2, fit_y * 2 - VIEWPORT[1] / 2)),
+        (f"annotations/zoom_10_steps/{tag}", zoom_in, lambda: built(fit_zoom, fit_x, fit_y)),
+    ]
+    return benchmarks + [(f"export/{fmt}/{tag}", export(fmt), None) for fmt in FORMAT_EXTENSIONS]
+
+def run(sizes, counts, repeat, work_dir, memory_budget, use_tk=False, pattern=None, out=sys.stdout):
+    """Run the suite and return {"meta": ..., "results": {name: stats}}."""
+    canvas, canvas_kind = make_canvas(use_tk)
+    renderer = TiledCanvasRenderer(canvas, photo_factory=ImageTk.PhotoImage if use_tk else headless_photo)
+    results = {}
+
+    def record(name, run_benchmark, setup):
+        if pattern and pattern not in name: return
+        times = measure(run_benchmark, repeat, setup)
+        results[name] = {"median_ms": statistics.median(times), "min_ms": min(times), "max_ms": max(times), "runs_ms": times}
+        print(f"{name:<40} {results[name]['median_ms']:>10.2f} ms  (min {results[name]['min_ms']:.2f})", file=out, flush=True)
+
+    def wanted(benchmarks):
+        return not pattern or any(pattern in name for name, _, _ in benchmarks)
+
+    for megapixels in sizes:
+        # Benchmarks only touch their inputs when run, so names can be checked before generating anything
+        if not wanted(render_benchmarks(None, megapixels, memory_budget, renderer)): continue
+        path = synthetic_image(work_dir, megapixels)
+        for benchmark in render_benchmarks(path, megapixels, memory_budget, renderer):
+            record(*benchmark)
+    renderer.set_pyramid(None)
+    with tempfile.TemporaryDirectory() as out_dir:
+        for count in counts:
+            if not wanted(annotation_benchmarks(AnnotationStore(), count, canvas, out_dir)): continue
+            store = synthetic_store(count)
+            for benchmark in annotation_benchmarks(store, count, canvas, out_dir):
+                record(*benchmark)
+
+    meta = {"date": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(), "numpy": np.__version__,
+            "pillow": PIL.__version__, "platform": platform.platform(), "machine": platform.machine(), "cpus": os.cpu_count(),
+            "canvas": canvas_kind, "repeat": repeat, "viewport": VIEWPORT, "memory_budget": memory_budget}
+    return {"meta": meta, "results": results}
+
+def compare(baseline, current, threshold=THRESHOLD, out=sys.stdout):
+    """Print current medians against a baseline's. Returns the names that got slower by more than threshold."""
+    for key in ("canvas", "machine", "cpus", "python"):
+        if baseline["meta"].get(key) != current["meta"].get(key):
+            print(f"note: {key} differs from the baseline ({baseline['meta'].get(key)} -> {current['meta'].get(key)})", file=out)
+    slower = []
+    print(f"{'benchmark':<40} {'baseline':>10} {'current':>10} {'change':>8}", file=out)
+    for name, stats in current["results"].items():
+        if name not in baseline["results"]:
+            print(f"{name:<40} {'-':>10} {stats['median_ms']:>10.2f} {'new':>8}", file=out)
+            continue
+        before, after = baseline["results"][name]["median_ms"], stats["median_ms"]
+        change = after / before - 1 if before else 0.0
+        flag = ""
+        if change > threshold and after - before > NOISE_FLOOR:
+            flag = "  SLOWER"
+            slower.append(name)
+        elif change < -threshold and before - after > NOISE_FLOOR:
+            flag = "  faster"
+        print(f"{name:<40} {before:>10.2f} {after:>10.2f} {change:>+8.1%}{flag}", file=out)
+    return slower
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark rendering, annotation and export paths on synthetic data")
+    parser.add_argument("--sizes", type=int, nargs="*", default=list(IMAGE_SIZES), help="Synthetic image sizes in megapixels (1 to 200)")
+    parser.add_argument("--counts", type=int, nargs="*", default=list(ANNOTATION_COUNTS), help="Synthetic annotation counts")
+    parser.add_argument("-r", "--repeat", type=int, default=5, help="Timed runs per benchmark, after one warm-up")
+    parser.add_argument("-k", dest="pattern", help="Only run benchmarks whose name contains this text")
+    parser.add_argument("--work-dir", default=os.path.join(tempfile.gettempdir(), "annotator-benchmark"), help="Where synthetic images are generated and kept between runs")
+    parser.add_argument("--memory-budget", type=int, default=DEFAULT_MEMORY_BUDGET >> 20, help="Decoded image memory per image in MB, as in main.py")
+    parser.add_argument("--tk", action="store_true", help="Redraw on a real Tk canvas (needs a display, e.g. under xvfb-run) instead of a headless one")
+    parser.add_argument("-o", "--save", help="Write the results as JSON, e.g. to keep as a baseline")
+    parser.add_argument("--compare", help="Baseline JSON to compare against; exits non-zero if anything got slower")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD, help="Relative slowdown that --compare flags (default 0.15)")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    current = run(args.sizes, args.counts, args.repeat, args.work_dir, args.memory_budget << 20, args.tk, args.pattern)
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(current, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(file=sys.stdout)
+        slower = compare(baseline, current, args.threshold)
+        if slower:
+            print(f"{len(slower)} benchmark(s) slower than the baseline by more than {args.threshold:.0%}", file=sys.stderr)
+            sys.exit(1)
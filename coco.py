@@ -0,0 +1,179 @@
+import os
+import json
+from array import array
+import numpy as np
+from dataset import atomic_file
+
+CHUNK_SIZE = 8 << 20 # bytes read from the file at a time while indexing
+INDEX_SUFFIX = ".index.npz"
+WHITESPACE = " \t\n\r"
+
+class _ArrayScanner:
+    """Walks a JSON document one value at a time without loading the whole file.
+
+    The file is decoded as latin-1, so every character is one byte and
+    positions in the buffer map directly to byte offsets in the file. JSON
+    structure is pure ASCII, so this is safe for locating values; strings
+    holding raw UTF-8 text come out mis-decoded, so values whose text
+    matters are parsed again from raw() bytes.
+    """
+    _decoder = json.JSONDecoder()
+
+    def __init__(self, f):
+        self.f = f
+        self.buf = ""
+        self.base = 0 # file offset of buf[0]
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        # Drop what has been consumed, then append the next chunk
+        self.base += self.pos
+        self.buf = self.buf[self.pos:]
+        self.pos = 0
+        chunk = self.f.read(CHUNK_SIZE)
+        if not chunk: self.eof = True
+        self.buf += chunk.decode("latin-1")
+
+    def peek(self):
+        """Next non-whitespace character, or "" at the end of the file."""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf) or self.eof: return self.buf[self.pos:self.pos + 1]
+            self._fill()
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"expected {char!r} at byte {self.base + self.pos}")
+        self.pos += 1
+
+    def value(self):
+        """Decode the next value. Returns (value, start offset, end offset) in file bytes."""
+        self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self.buf, self.pos)
+                # A number cut off by the chunk boundary still decodes; make sure it really ended
+                if end < len(self.buf) or self.eof:
+                    start, self.pos = self.base + self.pos, end
+                    return value, start, self.base + end
+            except json.JSONDecodeError:
+                if self.eof: raise
+            self._fill()
+
+    def raw(self, start, end):
+        """File bytes of the value just returned by value() or items()."""
+        return self.buf[start - self.base:end - self.base].encode("latin-1")
+
+    def items(self):
+        """Iterate (value, start, end) over the elements of the array at the current position."""
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            char = self.peek()
+            self.pos += 1
+            if char == "]": return
+            if char != ",": raise ValueError(f"expected ',' or ']' at byte {self.base + self.pos - 1}")
+
+class CocoIndex:
+    """Random access to the annotations of single images in a large COCO file.
+
+    The first open streams through the file once, parsing one record at a
+    time, and records the byte range of every annotation grouped by
+    image_id. The index (plus the small images and categories sections) is
+    saved next to the file and reused while the file's size and mtime are
+    unchanged. After that, loading an image reads only that image's records
+    from disk.
+    """
+    def __init__(self, file_path, use_cache=True):
+        self.file_path = file_path
+        self.index_path = file_path + INDEX_SUFFIX
+        stat = os.stat(file_path)
+        self.signature = np.array([stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+        if not (use_cache and self._load_index()):
+            self._build_index()
+            if use_cache: self._save_index()
+        self.by_file_name = {image["file_name"]: image_id for image_id, image in self.images.items()}
+
+    # --- Index ---
+    def _build_index(self):
+        images, categories = {}, {}
+        image_ids, offsets, lengths = array("q"), array("q"), array("q")
+        with open(self.file_path, "rb") as f:
+            scanner = _ArrayScanner(f)
+            scanner.expect("{")
+            while scanner.peek() not in ("}", ""):
+                key = scanner.value()[0]
+                scanner.expect(":")
+                if key == "annotations":
+                    for ann, start, end in scanner.items():
+                        image_ids.append(ann["image_id"])
+                        offsets.append(start)
+                        lengths.append(end - start)
+                elif key == "images":
+                    for image, start, end in scanner.items():
+                        image = json.loads(scanner.raw(start, end))
+                        images[image["id"]] = {"file_name": image["file_name"], "width": image.get("width"), "height": image.get("height")}
+                elif key == "categories":
+                    for category, start, end in scanner.items():
+                        category = json.loads(scanner.raw(start, end))
+                        categories[category["id"]] = category["name"]
+                else:
+                    scanner.value() # info, licenses, ...
+                if scanner.peek() == ",": scanner.pos += 1
+        # Group the records of each image together, keeping file order within an image
+        order = np.argsort(np.frombuffer(image_ids, dtype=np.int64), kind="stable")
+        self.ann_image_ids = np.frombuffer(image_ids, dtype=np.int64)[order]
+        self.ann_offsets = np.frombuffer(offsets, dtype=np.int64)[order]
+        self.ann_lengths = np.frombuffer(lengths, dtype=np.int64)[order]
+        self.images, self.categories = images, categories
+
+    def _save_index(self):
+        meta = json.dumps({"images": list(self.images.items()), "categories": list(self.categories.items())})
+        try:
+            with atomic_file(self.index_path, "wb") as f:
+                np.savez(f, signature=self.signature, meta=np.array(meta), image_ids=self.ann_image_ids, offsets=self.ann_offsets, lengths=self.ann_lengths)
+        except OSError:
+            pass # read-only location: the index is rebuilt next time
+
+    def _load_index(self):
+        try:
+            with np.load(self.index_path) as data:
+                if not np.array_equal(data["signature"], self.signature): return False
+                meta = json.loads(str(data["meta"]))
+                self.ann_image_ids, self.ann_offsets, self.ann_lengths = data["image_ids"], data["offsets"], data["lengths"]
+        except (OSError, KeyError, ValueError):
+            return False
+        self.images = {image_id: image for image_id, image in meta["images"]}
+        self.categories = {category_id: name for category_id, name in meta["categories"]}
+        return True
+
+    # --- Lookup ---
+    def image_id(self, image_path):
+        """Id of the image entry whose file_name matches image_path's name, or None."""
+        return self.by_file_name.get(os.path.basename(image_path))
+
+    def annotation_count(self, image_id):
+        return int(np.searchsorted(self.ann_image_ids, image_id, "right") - np.searchsorted(self.ann_image_ids, image_id))
+
+    def annotations(self, image_id):
+        """The raw annotation records of one image, read straight from their byte ranges."""
+        first, last = np.searchsorted(self.ann_image_ids, image_id), np.searchsorted(self.ann_image_ids, image_id, "right")
+        if first == last: return []
+        offsets, lengths = self.ann_offsets[first:last], self.ann_lengths[first:last]
+        start, end = int(offsets.min()), int((offsets + lengths).max())
+        with open(self.file_path, "rb") as f:
+            if end - start <= 2 * int(lengths.sum()) + CHUNK_SIZE // 8:
+                # Records of one image are usually adjacent: one read covers them all
+                f.seek(start)
+                span = f.read(end - start)
+                return [json.loads(span[o - start:o - start + n]) for o, n in zip(offsets.tolist(), lengths.tolist())]
+            records = []
+            for o, n in zip(offsets.tolist(), lengths.tolist()):
+                f.seek(o)
+                records.append(json.loads(f.read(n)))
+            return records
@@ -0,0 +1,277 @@
+import os
+import json
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from loader import LazyPyramid, DEFAULT_MEMORY_BUDGET
+from store import AnnotationStore, to_python
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".gif", ".tif", ".tiff")
+ANNOTATION_SUFFIX = ".ann.json"
+STORE_CACHE_SIZE = 256 # annotation stores kept in memory; older ones are already on disk
+
+def annotation_path(image_path):
+    """Path of the annotation file kept next to an image."""
+    return image_path + ANNOTATION_SUFFIX
+
+def list_images(directory):
+    return sorted(entry.path for entry in os.scandir(directory) if entry.is_file() and entry.name.lower().endswith(IMAGE_EXTENSIONS))
+
+@contextmanager
+def atomic_file(path, mode="w"):
+    """Open a temporary file in path's directory and move it over path when the block completes.
+
+    Readers never see a partial file; if the block raises, path is left untouched.
+    """
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, mode) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path): os.remove(tmp_path)
+        raise
+
+def atomic_write(path, data, mode="w"):
+    """Write data to path through a temporary file in the same directory, so readers never see a partial file."""
+    with atomic_file(path, mode) as f:
+        f.write(data)
+
+def store_to_dict(store, image_path, image_size):
+    """Native, lossless representation of an image's annotations."""
+    points = [tuple(p) for p in to_python(store.coords)]
+    offsets = store.offsets.tolist()
+    return {
+        "image": os.path.basename(image_path),
+        "size": list(image_size) if image_size else None,
+        "annotations": [
+            {"id": ann_id, "type": store.type_name(i), "label": store.label(i), "points": points[offsets[i]:offsets[i + 1]]}
+            for i, ann_id in enumerate(store.ids.tolist())
+        ]
+    }
+
+def store_from_dict(data):
+    store = AnnotationStore()
+    for ann in data["annotations"]:
+        store.append(ann["type"], ann["label"], ann["points"], ann_id=ann.get("id"))
+    return store
+
+def write_annotation_file(path, store, image_path, image_size):
+    atomic_write(path, json.dumps(store_to_dict(store, image_path, image_size), separators=(",", ":")))
+
+def read_annotation_file(path):
+    """Return (store, image_size) from a native annotation file. image_size may be None."""
+    with open(path) as f:
+        data = json.load(f)
+    return store_from_dict(data), tuple(data["size"]) if data.get("size") else None
+
+def fit_level(pyramid, fit_size):
+    """Pyramid level that shows the image fitted into fit_size, or None without a usable size."""
+    if not fit_size or min(fit_size) <= 1: return None
+    return pyramid.level_for_zoom(min(fit_size[0] / pyramid.size[0], fit_size[1] / pyramid.size[1]))
+
+def load_pyramid(image_path, fit_size=None, memory_budget=DEFAULT_MEMORY_BUDGET):
+    """Open an image and decode just the pyramid level needed to show it fitted into fit_size."""
+    pyramid = LazyPyramid(image_path, memory_budget)
+    k = fit_level(pyramid, fit_size)
+    if k is not None: pyramid.level(k)
+    return pyramid
+
+class LRUCache:
+    """Thread-safe least-recently-used cache bounded by the total size of its values in bytes."""
+    def __init__(self, max_bytes, sizeof):
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.entries = OrderedDict() # key -> (value, nbytes)
+        self.nbytes = 0
+        self.lock = threading.Lock()
+
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.entries
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None: return None
+            self.entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, value):
+        nbytes = self.sizeof(value)
+        with self.lock:
+            if key in self.entries:
+                self.nbytes -= self.entries.pop(key)[1]
+            self.entries[key] = (value, nbytes)
+            self.nbytes += nbytes
+            # Always keep the newest entry, even if it alone exceeds the budget
+            while self.nbytes > self.max_bytes and len(self.entries) > 1:
+                self.nbytes -= self.entries.popitem(last=False)[1][1]
+
+class DatasetSession:
+    """A directory of images opened for annotation.
+
+    Keeps per-image annotation stores in memory, saving each one to its
+    annotation file when the annotator moves away and loading it again on
+    return. A thread pool decodes and pre-scales the next images into an
+    LRU cache bounded by cache_bytes, so stepping to an image that was
+    prefetched only costs a cache lookup. Prefetching decodes only the
+    reduced level that fits the canvas; each image's finer levels are
+    decoded on zoom and bounded by memory_budget, and release() drops them
+    again when the annotator moves on, so the cache's accounting holds.
+    """
+    def __init__(self, directory, prefetch=4, cache_bytes=1 << 30, workers=2, fit_size=None, memory_budget=DEFAULT_MEMORY_BUDGET):
+        self.directory = directory
+        self.paths = list_images(directory)
+        self.position = 0
+        self.prefetch_count = prefetch
+        self.fit_size = fit_size
+        self.memory_budget = memory_budget
+        self.cache = LRUCache(cache_bytes, lambda pyramid: pyramid.nbytes())
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefetch")
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="annotation-writer")
+        self.pending = {} # path -> Future of a decode in flight
+        self.pending_lock = threading.Lock()
+        self.stores = OrderedDict() # path -> AnnotationStore
+        self.saved_versions = {} # path -> store version last written to disk
+        self.image_sizes = {}
+        self.counts = {} # path -> (annotation file mtime, annotation count) for images not in memory
+        self.counting = set() # paths whose annotation file is being counted
+
+    def __len__(self):
+        return len(self.paths)
+
+    # --- Images ---
+    def _decode(self, path):
+        try:
+            pyramid = load_pyramid(path, self.fit_size, self.memory_budget)
+            self.cache.put(path, pyramid)
+            return pyramid
+        finally:
+            with self.pending_lock:
+                self.pending.pop(path, None)
+
+    def _submit(self, path):
+        with self.pending_lock:
+            future = self.pending.get(path)
+            if future is None and path not in self.cache:
+                future = self.pending[path] = self.executor.submit(self._decode, path)
+            return future
+
+    def prefetch(self):
+        """Queue decodes for the next images (and the previous one) around the current position."""
+        for offset in [*range(1, self.prefetch_count + 1), -1]:
+            position = self.position + offset
+            if 0 <= position < len(self.paths):
+                self._submit(self.paths[position])
+
+    def pyramid(self, path):
+        """Decoded pyramid for an image: from the cache, from a decode in flight, or decoded now."""
+        pyramid = self.cache.get(path)
+        if pyramid is not None: return pyramid
+        future = self._submit(path)
+        if future is not None:
+            return future.result()
+        return self.cache.get(path) or self._decode(path)
+
+    def release(self, path):
+        """Trim an image that is no longer shown back to its fit level and recount its size in the cache."""
+        pyramid = self.cache.get(path)
+        if pyramid is None: return
+        k = fit_level(pyramid, self.fit_size)
+        pyramid.trim(pyramid.max_level + 1 if k is None else k)
+        self.cache.put(path, pyramid)
+
+    # --- Annotations ---
+    def store(self, path):
+        store = self.stores.get(path)
+        if store is None:
+            store = AnnotationStore()
+            ann_path = annotation_path(path)
+            if os.path.exists(ann_path):
+                store, size = read_annotation_file(ann_path)
+                if size: self.image_sizes[path] = size
+            self.stores[path] = store
+            self.saved_versions[path] = store.version
+            while len(self.stores) > STORE_CACHE_SIZE:
+                old_path, old_store = self.stores.popitem(last=False)
+                self.save(old_path, old_store)
+                self.saved_versions.pop(old_path, None)
+        self.stores.move_to_end(path)
+        return store
+
+    def forget(self, path):
+        """Drop an image's annotations from memory without saving them, e.g. after they failed to load. store() reads the file again."""
+        self.stores.pop(path, None)
+        self.saved_versions.pop(path, None)
+
+    def annotation_count(self, path):
+        """Number of annotations on an image, from memory or its annotation file.
+
+        A file is counted once per change, on the worker pool: until that
+        count is in, this returns None.
+        """
+        store = self.stores.get(path)
+        if store is not None: return len(store)
+        try:
+            mtime = os.stat(annotation_path(path)).st_mtime_ns
+        except OSError:
+            return 0
+        cached = self.counts.get(path)
+        if cached and cached[0] == mtime: return cached[1]
+        with self.pending_lock:
+            if path not in self.counting:
+                self.counting.add(path)
+                self.executor.submit(self._count, path, mtime)
+        return None
+
+    def _count(self, path, mtime):
+        count = 0
+        try:
+            with open(annotation_path(path)) as f:
+                # The mtime of the file actually read, in case it was replaced since the stat
+                mtime = os.fstat(f.fileno()).st_mtime_ns
+                count = len(json.load(f)["annotations"])
+        except (OSError, ValueError, KeyError):
+            pass
+        self.counts[path] = (mtime, count)
+        with self.pending_lock:
+            self.counting.discard(path)
+
+    def replace_store(self, path, store):
+        """Use store as an image's annotations from now on, e.g. after an import. It is saved on the next save()."""
+        self.stores[path] = store
+        self.stores.move_to_end(path)
+        self.saved_versions[path] = None
+
+    def mark_saved(self, path, image_size=None):
+        """Record that an image's annotations were written to disk elsewhere, e.g. by its edit journal."""
+        store = self.stores.get(path)
+        if store is not None: self.saved_versions[path] = store.version
+        if image_size: self.image_sizes[path] = image_size
+
+    def save(self, path, store=None, image_size=None):
+        """Write an image's annotations to disk on the writer thread if they changed since the last save."""
+        if store is None: store = self.stores.get(path)
+        if store is None or self.saved_versions.get(path) == store.version: return
+        image_size = image_size or self.image_sizes.get(path)
+        if image_size: self.image_sizes[path] = image_size
+        # Snapshot on the calling thread so later edits cannot race with the write
+        payload = json.dumps(store_to_dict(store, path, image_size), separators=(",", ":"))
+        self.saved_versions[path] = store.version
+        self.writer.submit(atomic_write, annotation_path(path), payload)
+
+    # --- Navigation ---
+    def go_to(self, position):
+        if not 0 <= position < len(self.paths): return
+        self.position = position
+        self.prefetch()
+
+    def close(self):
+        for path, store in self.stores.items():
+            self.save(path, store)
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.writer.shutdown(wait=True)
@@ -0,0 +1,49 @@
+import numpy as np
+
+def _segment_distances(points, start, end):
+    """Distance of every point to the segment start-end."""
+    edge = end - start
+    length_sq = float(edge @ edge)
+    if length_sq == 0:
+        return np.hypot(*(points - start).T)
+    t = np.clip(((points - start) @ edge) / length_sq, 0, 1)
+    return np.hypot(*(points - (start + t[:, None] * edge)).T)
+
+def douglas_peucker(points, tolerance):
+    """Douglas-Peucker simplification of an open polyline given as an (n, 2) array.
+
+    The recursion runs on an explicit stack and each step measures a whole
+    span of points at once. Returns the kept vertices, endpoints included.
+    """
+    points = np.asarray(points, dtype=np.float64)
+    n = len(points)
+    if n < 3 or tolerance <= 0: return points
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2: continue
+        distances = _segment_distances(points[first + 1:last], points[first], points[last])
+        worst = int(np.argmax(distances))
+        if distances[worst] > tolerance:
+            split = first + 1 + worst
+            keep[split] = True
+            stack.append((first, split))
+            stack.append((split, last))
+    return points[keep]
+
+def simplify_polygon(points, tolerance):
+    """Douglas-Peucker for a closed ring. Keeps at least three vertices when the input has them."""
+    points = np.asarray(points, dtype=np.float64)
+    if len(points) <= 3 or tolerance <= 0: return points
+    # Split the ring at the vertex farthest from the first one so both halves are well conditioned
+    far = int(np.argmax(np.hypot(*(points - points[0]).T)))
+    head = douglas_peucker(points[:far + 1], tolerance)
+    tail = douglas_peucker(np.vstack((points[far:], points[:1])), tolerance)
+    ring = np.vstack((head, tail[1:-1]))
+    if len(ring) < 3:
+        # A sliver: keep the vertex that sticks out most so it still reads as an area
+        widest = int(np.argmax(_segment_distances(points, points[0], points[far])))
+        ring = points[sorted({0, widest, far})]
+    return ring
@@ -0,0 +1,228 @@
+import os
+import json
+import threading
+from dataset import annotation_path, atomic_write, store_to_dict
+from store import to_python
+
+JOURNAL_SUFFIX = ".ann.journal"
+FLUSH_INTERVAL = 0.5 # seconds between background flushes
+COMPACT_EVERY = 1000 # journal records before a snapshot, at least one per annotation
+
+def journal_path(image_path):
+    """Path of the edit journal kept next to an image."""
+    return image_path + JOURNAL_SUFFIX
+
+def replay(store, path):
+    """Apply the records of a journal file to store, the snapshot it was written against.
+
+    Every record applies idempotently (adds of ids the snapshot already
+    accounts for, and edits of ids that no longer exist, are skipped), so
+    replaying a journal that a crash left behind after a newer snapshot is
+    harmless. Lines that do not parse (a record torn by a crash or a failed
+    write) are skipped. Returns the number of records applied.
+    """
+    applied = 0
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            op = record["op"]
+            if op == "add":
+                if len(store) and record["id"] <= store.ids[-1]: continue
+                store.append(record["type"], record["label"], record["points"], ann_id=record["id"])
+            else:
+                indices = [i for i in (store.index_of(ann_id) for ann_id in record["ids"]) if i >= 0]
+                if not indices: continue
+                if op == "delete":
+                    store.delete(indices)
+                elif op == "relabel":
+                    store.set_label(indices, record["label"])
+                elif op == "move":
+                    points = {ann_id: p for ann_id, p in zip(record["ids"], record["points"])}
+                    for i in indices:
+                        store.set_points(i, points[int(store.ids[i])])
+            applied += 1
+    return applied
+
+class EditJournal:
+    """Append-only log of the edits made to one image's annotations.
+
+    Each edit appends one small JSON line (add, delete, relabel or move)
+    to an in-memory batch, so logging costs the same however many
+    annotations the image has. A background thread writes and fsyncs the
+    batch every flush_interval seconds. Once the journal holds as many
+    records as the image has annotations (and at least COMPACT_EVERY), the
+    next edit snapshots the store to the image's annotation file and the
+    journal starts over, which keeps replay short and the snapshot cost
+    amortized O(1) per edit. Snapshots copy the store's columns on the
+    caller's thread and are encoded and written on the writer thread, so
+    the UI never waits for JSON or the disk. close() queues a final
+    snapshot and returns; the thread removes the journal once it is
+    written, and wait() blocks until then. The journal file and its thread only come into being with
+    the first edit, so an image that is only looked at gets no files and
+    costs nothing to close.
+
+    A write that fails (disk full, read-only folder) leaves its records
+    queued to be retried on the next flush, and the error in self.error
+    for the application to report. wait() raises it after close(), and a
+    journal whose edits did not reach the snapshot is left in place.
+
+    open() replays whatever journal a crash left behind onto the loaded
+    snapshot, folds it into the snapshot, and starts a new journal for the
+    image.
+    """
+    def __init__(self, image_path, image_size, flush_interval=FLUSH_INTERVAL, compact_every=COMPACT_EVERY):
+        self.image_path = image_path
+        self.image_size = image_size
+        self.path = journal_path(image_path)
+        self.snapshot_path = annotation_path(image_path)
+        self.flush_interval = flush_interval
+        self.compact_every = compact_every
+        self.records = 0 # records since the last snapshot
+        self.pending = [] # journal lines, or ("snapshot", store copy) markers, in edit order
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.closed = False
+        self.error = None # OSError of the last failed flush, cleared by the next good one
+        self.changed = False # anything logged or compacted since open
+        self.file = None # opened by the first write
+        self.torn = False # the file may end in part of a line
+        self.thread = None # started by the first edit
+
+    @classmethod
+    def open(cls, image_path, store, image_size, **kwargs):
+        """Replay a journal left by a crash onto store and start journaling. Returns (journal, records recovered)."""
+        path = journal_path(image_path)
+        recovered = 0
+        if os.path.exists(path):
+            recovered = replay(store, path)
+            # Fold the recovered edits into the snapshot before the old journal goes
+            if recovered: atomic_write(annotation_path(image_path), cls._snapshot(store, image_path, image_size))
+            os.remove(path)
+        return cls(image_path, image_size, **kwargs), recovered
+
+    @staticmethod
+    def _snapshot(store, image_path, image_size):
+        return json.dumps(store_to_dict(store, image_path, image_size), separators=(",", ":"))
+
+    # --- Writer thread ---
+    def _run(self):
+        while not self.closed:
+            self.wake.wait(self.flush_interval)
+            self.wake.clear()
+            self._flush()
+        self._flush()
+        if self.file:
+            self.file.close()
+            self.file = None
+        if not self.error and os.path.exists(self.path): os.remove(self.path)
+
+    def _flush(self):
+        with self.lock:
+            batch, self.pending = self.pending, []
+        if not batch: return
+        lines = []
+        done = 0 # items of batch known to be on disk
+        try:
+            for n, item in enumerate(batch):
+                if isinstance(item, str):
+                    lines.append(item)
+                    continue
+                self._write(lines)
+                lines, done = [], n
+                # The snapshot covers every record before it, so the journal can start over
+                atomic_write(self.snapshot_path, self._snapshot(item[1], self.image_path, self.image_size))
+                done = n + 1
+                if self.file:
+                    self.file.close()
+                    self.file, self.torn = None, False
+                    os.remove(self.path)
+            self._write(lines)
+            self.error = None
+        except OSError as e:
+            # Retry what is not known to be written; a line written twice replays harmlessly
+            self.error = e
+            with self.lock:
+                self.pending[:0] = batch[done:]
+
+    def _write(self, lines):
+        if not lines: return
+        # Unbuffered, so a failed write leaves nothing behind to be flushed later
+        if self.file is None: self.file = open(self.path, "wb", buffering=0)
+        data = ("\n" if self.torn else "") + "".join(lines)
+        end = self.file.tell()
+        try:
+            view = memoryview(data.encode("utf-8"))
+            while view:
+                view = view[os.write(self.file.fileno(), view):]
+            os.fsync(self.file.fileno())
+            self.torn = False
+        except OSError:
+            # Cut the file back to its last complete line so the retry does not append to half a record
+            try:
+                self.file.truncate(end)
+                self.file.seek(end)
+            except OSError:
+                self.torn = True # the retry starts on a new line instead; replay skips the torn one
+            raise
+
+    # --- Logging ---
+    def _start(self):
+        self.changed = True
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name="edit-journal", daemon=True)
+            self.thread.start()
+
+    def _log(self, record, store):
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        with self.lock:
+            self.pending.append(line)
+        self._start()
+        self.records += 1
+        if self.records >= max(self.compact_every, len(store)):
+            self.compact(store)
+
+    def log_add(self, store, i):
+        self._log({"op": "add", "id": int(store.ids[i]), "type": store.type_name(i), "label": store.label(i), "points": to_python(store.points(i))}, store)
+
+    def log_delete(self, store, ann_ids):
+        self._log({"op": "delete", "ids": sorted(ann_ids)}, store)
+
+    def log_relabel(self, store, ann_ids, label):
+        self._log({"op": "relabel", "ids": sorted(ann_ids), "label": label}, store)
+
+    def log_move(self, store, indices):
+        """Record the new vertices of moved annotations (absolute, so replay is idempotent)."""
+        self._log({"op": "move", "ids": store.ids[indices].tolist(), "points": [to_python(store.points(i)) for i in indices]}, store)
+
+    def compact(self, store):
+        """Queue a snapshot of store; the journal restarts once it is written. Call after wholesale changes."""
+        snapshot = store.copy()
+        with self.lock:
+            self.pending.append(("snapshot", snapshot))
+        self.records = 0
+        self._start()
+
+    def close(self, store):
+        """Queue a final snapshot and let the writer thread finish in the background. Does nothing if there were no edits."""
+        if not self.changed: return
+        self.compact(store)
+        self.closed = True
+        self.wake.set()
+
+    @property
+    def done(self):
+        """Whether the writer thread has finished (or never started)."""
+        return self.thread is None or not self.thread.is_alive()
+
+    def wait(self):
+        """Block until the writer thread has finished after close().
+
+        Raises the OSError if the final snapshot could not be written; the
+        journal is then left in place, to be replayed when the image is
+        opened again.
+        """
+        if self.thread: self.thread.join()
+        if self.error: raise self.error
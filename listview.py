@@ -0,0 +1,239 @@
+import os
+import tkinter as tk
+import numpy as np
+from PIL import Image, ImageTk
+
+ROW_HEIGHT = 18
+ROW_PADDING = 4
+SELECTED_BG = "#3874d8"
+FILMSTRIP_BG = "#202020"
+BADGE_BG = "#d83838"
+THUMBNAIL_POLL_INTERVAL = 100 # ms between checks for finished thumbnails
+
+class VirtualList(tk.Frame):
+    """Scrollable list of annotation ids that only draws the rows in view.
+
+    The rows are an array of ids in ascending order (store row order, or a
+    label's ids), so locating a row is a binary search. A fixed pool of
+    canvas items, one per visible row, is re-pointed at whichever ids are
+    scrolled into view, which keeps scrolling, inserting and deleting
+    independent of the number of rows. row_text(ann_id) supplies the text
+    of a row when it is drawn. Selection follows Listbox's extended mode
+    (click, Ctrl-click, Shift-click) and is reported to on_select as a set
+    of ids.
+    """
+    def __init__(self, parent, row_text, on_select=None, row_height=ROW_HEIGHT, **kwargs):
+        super().__init__(parent, **kwargs)
+        self.row_text = row_text
+        self.on_select = on_select
+        self.row_height = row_height
+        self.canvas = tk.Canvas(self, bg="white", highlightthickness=0, width=1)
+        self.scrollbar = tk.Scrollbar(self, orient="vertical", command=self.yview)
+        self.scrollbar.pack(side="right", fill="y")
+        self.canvas.pack(side="left", fill="both", expand=True)
+        self.rows = np.empty(0, dtype=np.int64)
+        self.top = 0 # first visible row
+        self.selected = set()
+        self.anchor = None # id that Shift-click extends from
+        self.pool = [] # (background rect, text) item pairs, one per visible row
+
+        self.canvas.bind("<Configure>", lambda event: self.refresh())
+        self.canvas.bind("<ButtonPress-1>", self.on_click)
+        self.canvas.bind("<MouseWheel>", lambda event: self.yview("scroll", -1 if event.delta > 0 else 1, "units"))
+        self.canvas.bind("<Button-4>", lambda event: self.yview("scroll", -1, "units"))
+        self.canvas.bind("<Button-5>", lambda event: self.yview("scroll", 1, "units"))
+
+    # --- Model ---
+    def set_rows(self, rows):
+        self.rows = np.asarray(rows, dtype=np.int64)
+        self.refresh()
+
+    def position(self, ann_id):
+        """Row of an id, or -1 when it is not in the list."""
+        i = int(np.searchsorted(self.rows, ann_id))
+        return i if i < len(self.rows) and self.rows[i] == ann_id else -1
+
+    def set_selection(self, ann_ids):
+        self.selected = set(ann_ids)
+        if self.anchor not in self.selected: self.anchor = None
+        self.refresh()
+
+    # --- View ---
+    def visible_count(self):
+        return max(1, self.canvas.winfo_height() // self.row_height)
+
+    def _scroll_to(self, top):
+        self.top = max(0, min(int(top), len(self.rows) - self.visible_count()))
+        self.refresh()
+
+    def yview(self, *args):
+        """Scrollbar protocol: ("moveto", fraction) or ("scroll", n, "units" | "pages")."""
+        if args[0] == "moveto":
+            self._scroll_to(float(args[1]) * len(self.rows))
+        elif args[0] == "scroll":
+            step = self.visible_count() if args[2] == "pages" else 1
+            self._scroll_to(self.top + int(args[1]) * step)
+
+    def see(self, ann_id):
+        row = self.position(ann_id)
+        if row < 0: return
+        if row < self.top:
+            self._scroll_to(row)
+        elif row >= self.top + self.visible_count():
+            self._scroll_to(row - self.visible_count() + 1)
+
+    def refresh(self):
+        """Point the item pool at the rows currently in view."""
+        count = self.visible_count() + 1
+        width = self.canvas.winfo_width()
+        while len(self.pool) < count:
+            y = len(self.pool) * self.row_height
+            self.pool.append((
+                self.canvas.create_rectangle(0, y, width, y + self.row_height, outline="", fill=""),
+                self.canvas.create_text(ROW_PADDING, y + self.row_height / 2, anchor="w", text="")))
+        self.top = max(0, min(self.top, len(self.rows) - self.visible_count()))
+        for slot, (rect_id, text_id) in enumerate(self.pool):
+            row = self.top + slot
+            if slot < count and row < len(self.rows):
+                ann_id = int(self.rows[row])
+                selected = ann_id in self.selected
+                y = slot * self.row_height
+                self.canvas.coords(rect_id, 0, y, width, y + self.row_height)
+                self.canvas.itemconfig(rect_id, fill=SELECTED_BG if selected else "", state="normal")
+                self.canvas.itemconfig(text_id, text=self.row_text(ann_id), fill="white" if selected else "black", state="normal")
+            else:
+                self.canvas.itemconfig(rect_id, state="hidden")
+                self.canvas.itemconfig(text_id, state="hidden")
+        n = len(self.rows)
+        if n: self.scrollbar.set(self.top / n, min(1.0, (self.top + self.visible_count()) / n))
+        else: self.scrollbar.set(0, 1)
+
+    # --- Selection ---
+    def on_click(self, event):
+        row = self.top + event.y // self.row_height
+        if row >= len(self.rows): return
+        ann_id = int(self.rows[row])
+        if event.state & 0x0001 and self.anchor is not None and self.position(self.anchor) >= 0: # Shift: range
+            start, end = sorted((self.position(self.anchor), row))
+            self.selected = set(self.rows[start:end + 1].tolist())
+        elif event.state & 0x0004: # Control: toggle
+            self.selected ^= {ann_id}
+            self.anchor = ann_id
+        else:
+            self.selected = {ann_id}
+            self.anchor = ann_id
+        self.refresh()
+        if self.on_select: self.on_select(set(self.selected))
+
+class Filmstrip(VirtualList):
+    """Vertical strip of thumbnails for the images of a folder, virtualized like VirtualList.
+
+    Rows are image positions. Thumbnails are requested from a
+    ThumbnailCache only for the rows in view and the next screenful; until
+    one is ready its cell shows the file name, and a poll fills it in once
+    the cache has built it. Builds for rows scrolled away are cancelled. A
+    badge shows each image's annotation_count(path); while that returns
+    None (still being counted) the same poll fills the badge in later.
+    """
+    def __init__(self, parent, cache, paths, annotation_count, on_select=None, **kwargs):
+        self.cache = cache
+        self.paths = paths
+        self.annotation_count = annotation_count
+        self.photos = {} # position -> PhotoImage, for rows in view only
+        self.poll_job = None
+        self.counts_pending = False # a badge in view is waiting for its count
+        super().__init__(parent, lambda position: os.path.basename(paths[position]), on_select, row_height=cache.size + 2 * ROW_PADDING, **kwargs)
+        self.canvas.config(width=cache.size + 2 * ROW_PADDING, bg=FILMSTRIP_BG)
+        self.set_rows(np.arange(len(paths)))
+
+    def refresh(self):
+        count = self.visible_count() + 1
+        width, height = self.canvas.winfo_width(), self.row_height
+        while len(self.pool) < count:
+            y = len(self.pool) * height
+            self.pool.append((
+                self.canvas.create_rectangle(0, y, width, y + height, outline="", fill=""),
+                self.canvas.create_text(ROW_PADDING, y + height / 2, anchor="w", fill="white", width=self.cache.size),
+                self.canvas.create_image(width / 2, y + height / 2, anchor="center"),
+                self.canvas.create_rectangle(0, 0, 0, 0, outline="", fill=BADGE_BG),
+                self.canvas.create_text(0, 0, anchor="ne", fill="white")))
+        self.top = max(0, min(self.top, len(self.rows) - self.visible_count()))
+
+        photos = {}
+        self.counts_pending = False
+        for slot, (rect_id, text_id, image_id, badge_id, badge_text_id) in enumerate(self.pool):
+            position = self.top + slot
+            items = (rect_id, text_id, image_id, badge_id, badge_text_id)
+            if slot >= count or position >= len(self.rows):
+                for item in items: self.canvas.itemconfig(item, state="hidden")
+                continue
+            y = slot * height
+            path = self.paths[position]
+            photo = self.photos.get(position)
+            if photo is None:
+                thumbnail_path = self.cache.get(path)
+                if thumbnail_path:
+                    with Image.open(thumbnail_path) as thumbnail:
+                        photo = ImageTk.PhotoImage(thumbnail)
+            if photo is not None: photos[position] = photo
+            self.canvas.coords(rect_id, 0, y, width, y + height)
+            self.canvas.itemconfig(rect_id, fill=SELECTED_BG if position in self.selected else "", state="normal")
+            self.canvas.coords(text_id, ROW_PADDING, y + height / 2)
+            self.canvas.itemconfig(text_id, text=os.path.basename(path), state="hidden" if photo else "normal")
+            self.canvas.coords(image_id, width / 2, y + height / 2)
+            self.canvas.itemconfig(image_id, image=photo or "", state="normal")
+            self._draw_badge(slot, path, width)
+        self.photos = photos
+
+        # Warm the next screenful and drop queued builds for everything else
+        end = min(len(self.rows), self.top + 2 * count)
+        for position in range(self.top + count, end):
+            self.cache.get(self.paths[position])
+        self.cache.keep_only(self.paths[self.top:end])
+        self._schedule_poll()
+
+        n = len(self.rows)
+        if n: self.scrollbar.set(self.top / n, min(1.0, (self.top + self.visible_count()) / n))
+        else: self.scrollbar.set(0, 1)
+
+    def _draw_badge(self, slot, path, width):
+        badge_id, badge_text_id = self.pool[slot][3:]
+        annotations = self.annotation_count(path)
+        if annotations is None: self.counts_pending = True
+        if annotations:
+            x1, y1 = width - ROW_PADDING - 2, slot * self.row_height + ROW_PADDING + 2
+            self.canvas.coords(badge_text_id, x1, y1)
+            self.canvas.itemconfig(badge_text_id, text=str(annotations), state="normal")
+            bx1, by1, bx2, by2 = self.canvas.bbox(badge_text_id)
+            self.canvas.coords(badge_id, bx1 - 3, by1 - 1, bx2 + 3, by2 + 1)
+            self.canvas.itemconfig(badge_id, state="normal")
+        else:
+            self.canvas.itemconfig(badge_id, state="hidden")
+            self.canvas.itemconfig(badge_text_id, state="hidden")
+
+    def update_badge(self, position):
+        """Redraw one image's annotation count badge after its annotations changed, leaving the other rows alone."""
+        slot = position - self.top
+        if 0 <= slot < min(len(self.pool), self.visible_count() + 1) and position < len(self.rows):
+            self._draw_badge(slot, self.paths[position], self.canvas.winfo_width())
+            self._schedule_poll()
+
+    def _schedule_poll(self):
+        if (self.cache.busy() or self.counts_pending) and self.poll_job is None:
+            self.poll_job = self.after(THUMBNAIL_POLL_INTERVAL, self._poll)
+
+    def _poll(self):
+        self.poll_job = None
+        if self.cache.take_ready() or self.cache.busy() or self.counts_pending:
+            self.refresh()
+
+    def on_click(self, event):
+        position = self.top + event.y // self.row_height
+        if position >= len(self.rows): return
+        self.selected = {position}
+        self.refresh()
+        if self.on_select: self.on_select(position)
+
+    def destroy(self):
+        if self.poll_job: self.after_cancel(self.poll_job)
+        super().destroy()
@@ -0,0 +1,220 @@
+import math
+import threading
+from collections import OrderedDict
+from PIL import Image, ImageFile
+from render import TilePyramid, TILE_SIZE, pyramid_mode
+
+DEFAULT_MEMORY_BUDGET = 512 << 20 # bytes
+JPEG_MAX_DRAFT_LEVEL = 3 # libjpeg can decode directly at 1/2, 1/4 and 1/8 scale
+BAND_BYTES = 32 << 20 # full-resolution pixels decoded at a time for banded formats
+# Band decoding drives Pillow's decoders through private APIs; if a Pillow release changes them, images decode whole
+BAND_ERRORS = (AttributeError, TypeError, OSError)
+_open_lock = threading.Lock()
+
+def open_unchecked(path):
+    """Image.open without Pillow's decompression-bomb check, which LazyPyramid replaces with its memory budget.
+
+    The check reads a module global, so it is switched off only for the
+    duration of this call, under a lock shared by the loader's threads.
+    """
+    with _open_lock:
+        max_pixels, Image.MAX_IMAGE_PIXELS = Image.MAX_IMAGE_PIXELS, None
+        try:
+            return Image.open(path)
+        finally:
+            Image.MAX_IMAGE_PIXELS = max_pixels
+
+def band_tiles(image, factor=1, band_bytes=BAND_BYTES):
+    """The tiles of an opened, unloaded image regrouped into horizontal bands that decode independently.
+
+    Returns [(top, bottom, tiles)], or None when the image is one compressed
+    stream (PNG, GIF, compressed TIFF) that can only be decoded whole. Raw
+    tiles (BMP, PPM, TGA, uncompressed TIFF) are cut at band boundaries;
+    other tiles such as TIFF strips are grouped whole. Bands start on
+    multiples of factor, so reducing them one at a time gives the same
+    pixels as reducing the whole image.
+    """
+    if image.mode == "P" or not image.tile: return None
+    width = image.size[0]
+    band_rows = max(factor, band_bytes // max(1, width * len(image.getbands())) // factor * factor)
+    pieces = []
+    for tile in image.tile:
+        codec, (x0, y0, x1, y1), offset, args = tile
+        if Image._getdecoder(image.mode, codec, args, image.decoderconfig).pulls_fd: return None
+        if codec != "raw":
+            if len(image.tile) == 1: return None
+            pieces.append((y0, x0, y1, tile))
+            continue
+        rawmode, stride, orientation = (args, 0, 1) if isinstance(args, str) else (tuple(args) + (0, 1))[:3]
+        if not stride:
+            try:
+                stride = len(Image.new(image.mode, (x1 - x0, 1)).tobytes("raw", rawmode))
+            except (ValueError, OSError):
+                return None
+        for top in range(y0, y1, band_rows):
+            bottom = min(y1, top + band_rows)
+            # Bottom-up files store the last row first
+            row = top - y0 if orientation > 0 else y1 - bottom
+            pieces.append((top, x0, bottom, ImageFile._Tile(codec, (x0, top, x1, bottom), offset + row * stride, (rawmode, stride, orientation))))
+    pieces.sort(key=lambda piece: piece[:2])
+    bands, tiles, top, bottom = [], [], 0, 0
+    for y0, x0, y1, tile in pieces:
+        if tiles and y0 >= bottom and bottom - top >= band_rows and bottom % factor == 0:
+            bands.append((top, bottom, tiles))
+            tiles, top = [], bottom
+        tiles.append(tile)
+        bottom = max(bottom, y1)
+    bands.append((top, bottom, tiles))
+    return bands
+
+def _decode_tile(image, target, tile, top):
+    """Decode one tile of image into target, a band whose first row is image row top."""
+    codec, (x0, y0, x1, y1), offset, args = tile
+    decoder = Image._getdecoder(image.mode, codec, args, image.decoderconfig)
+    try:
+        decoder.setimage(target.im, (x0, y0 - top, x1, y1 - top))
+        image.fp.seek(offset)
+        data = b""
+        while True:
+            chunk = image.fp.read(image.decodermaxblock)
+            if not chunk: raise OSError("image file is truncated")
+            data += chunk
+            n, error = decoder.decode(data)
+            if n < 0: break
+            data = data[n:]
+        if error < 0: raise OSError(f"decoder error {error} in {image.filename}")
+    finally:
+        decoder.cleanup()
+
+class LazyPyramid(TilePyramid):
+    """Tile pyramid that decodes an image file on demand, at the coarsest scale each view needs.
+
+    Opening only reads the header. A level is decoded the first time a zoom
+    needs it: JPEGs are decoded at 1/2, 1/4 or 1/8 scale through draft(),
+    the rest is made with reduce(), and finer cached levels are reduced
+    instead of going back to the file. Full resolution is only decoded when
+    the user zooms in far enough to need it.
+
+    Decoded levels are kept in an LRU bounded by memory_budget bytes. Levels
+    whose decode would not fit in the budget are never decoded; views that
+    would need them upsample the finest level that fits. Other formats
+    cannot be decoded scaled down; raw ones (BMP, PPM, TGA, uncompressed
+    TIFF) are decoded a band at a time, each band reduced before the next,
+    so the peak stays one band above the level itself. Single-stream
+    formats (PNG, GIF, compressed TIFF) have to be decoded whole, and their
+    peak is counted as such. Sizes and zoom stay relative to the original
+    image, so coordinates are always in original-image pixels.
+
+    Pillow's decompression-bomb limit is replaced by the budget: an image
+    over Pillow's limit opens as long as the coarsest decode it needs fits
+    in memory_budget, and raises Image.DecompressionBombError otherwise.
+    """
+    def __init__(self, path, memory_budget=DEFAULT_MEMORY_BUDGET, tile_size=TILE_SIZE):
+        self.path = path
+        self.tile_size = tile_size
+        self.memory_budget = memory_budget
+        with open_unchecked(path) as image:
+            self.size = image.size
+            self.format = image.format
+            self.mode = pyramid_mode(image)
+            try:
+                self.banded = self.format != "JPEG" and band_tiles(image) is not None
+            except BAND_ERRORS:
+                self.banded = False
+            self.band_bytes = min(BAND_BYTES, image.size[0] * image.size[1] * len(image.getbands()))
+        self.bands = len(self.mode)
+        self.max_level = max(0, math.ceil(math.log2(max(max(self.size), 1) / tile_size)))
+        self.cache = OrderedDict() # level -> decoded image, least recently used first
+        self.min_level = self._min_level()
+        max_pixels = Image.MAX_IMAGE_PIXELS
+        if max_pixels and self.size[0] * self.size[1] > 2 * max_pixels and self._decode_bytes(self.min_level) > memory_budget:
+            raise Image.DecompressionBombError(f"{self.size[0]} x {self.size[1]} image needs {self._decode_bytes(self.min_level) >> 20} MB to decode, over the {memory_budget >> 20} MB memory budget")
+
+    def _min_level(self):
+        """Finest level whose decode fits in the memory budget."""
+        return next((k for k in range(self.max_level + 1) if self._decode_bytes(k) <= self.memory_budget), self.max_level)
+
+    @property
+    def levels(self):
+        return list(self.cache.values())
+
+    def _level_bytes(self, k):
+        w, h = self.size
+        return -(-w >> k) * -(-h >> k) * self.bands
+
+    def _decode_bytes(self, k):
+        """Peak bytes held while producing level k straight from the file."""
+        if self.format == "JPEG":
+            return max(self._level_bytes(k), self._level_bytes(min(k, JPEG_MAX_DRAFT_LEVEL)))
+        if k == 0: return self._level_bytes(0)
+        # One full-resolution band (plus rounding to whole rows), or the whole image
+        full = self._level_bytes(0)
+        if self.banded: full = min(full, self.band_bytes + (self.size[0] << k) * self.bands)
+        return full + self._level_bytes(k)
+
+    def level_for_zoom(self, zoom):
+        return max(self.min_level, super().level_for_zoom(zoom))
+
+    def level(self, k):
+        k = max(k, self.min_level)
+        image = self.cache.get(k)
+        if image is not None:
+            self.cache.move_to_end(k)
+            return image
+        finer = [j for j in self.cache if j < k]
+        if finer:
+            j = max(finer)
+            image = self.cache[j].reduce(2 ** (k - j))
+        else:
+            image = self._decode(k)
+        self.cache[k] = image
+        self._evict(keep=k)
+        return image
+
+    def _decode(self, k):
+        if self.format != "JPEG" and self.banded and k:
+            try:
+                return self._decode_bands(k)
+            except BAND_ERRORS:
+                # Decode whole from now on; later views stay at the levels that fit without banding
+                self.banded = False
+                self.min_level = self._min_level()
+        with open_unchecked(self.path) as image:
+            if self.format == "JPEG" and k:
+                s = min(k, JPEG_MAX_DRAFT_LEVEL)
+                image.draft(None, (max(1, self.size[0] >> s), max(1, self.size[1] >> s)))
+            image.load()
+            if image.mode != self.mode:
+                image = image.convert(self.mode)
+        # draft() may have covered part of the reduction; reduce() does the rest
+        remaining = k - int(round(math.log2(self.size[0] / image.size[0])))
+        if remaining > 0:
+            image = image.reduce(2 ** remaining)
+        return image
+
+    def _decode_bands(self, k):
+        factor = 2 ** k
+        with open_unchecked(self.path) as image:
+            w, h = image.size
+            level = Image.new(self.mode, (-(-w // factor), -(-h // factor)))
+            for top, bottom, tiles in band_tiles(image, factor, self.band_bytes):
+                band = Image.new(image.mode, (w, bottom - top))
+                for tile in tiles:
+                    _decode_tile(image, band, tile, top)
+                if band.mode != self.mode: band = band.convert(self.mode)
+                level.paste(band.reduce(factor), (0, top // factor))
+        return level
+
+    def trim(self, k):
+        """Drop the cached levels finer than k, e.g. once the image is no longer zoomed into."""
+        for j in [j for j in self.cache if j < k]:
+            del self.cache[j]
+
+    def _evict(self, keep):
+        while self.nbytes() > self.memory_budget and len(self.cache) > 1:
+            oldest = next(iter(self.cache))
+            if oldest == keep:
+                self.cache.move_to_end(keep)
+                continue
+            del self.cache[oldest]
+
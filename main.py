@@ -1,7 +1,30 @@
+import argparse
 import tkinter as tk
+from PIL import Image
+import telemetry
 from app import BboxCoordinatesPicker
 
+FILTERS = {
+    "nearest": Image.Resampling.NEAREST,
+    "bilinear": Image.Resampling.BILINEAR,
+    "bicubic": Image.Resampling.BICUBIC,
+    "lanczos": Image.Resampling.LANCZOS,
+}
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Image annotation tool")
+    parser.add_argument("--preview-filter", choices=FILTERS, default="bilinear", help="Resampling filter used while zooming or panning")
+    parser.add_argument("--final-filter", choices=FILTERS, default="lanczos", help="Resampling filter used once input is idle")
+    parser.add_argument("--refine-delay", type=int, default=200, help="Idle time in ms before the final-quality render")
+    parser.add_argument("--memory-budget", type=int, default=512, help="Decoded image memory per image in MB; larger images are shown at reduced resolution")
+    parser.add_argument("--profile", metavar="PATH", help=f"Time the rendering, input and I/O paths and write a report to PATH on exit (also ${telemetry.PROFILE_ENV})")
+    parser.add_argument("--profile-format", choices=telemetry.FORMATS, help="Report format; by default .csv gives CSV, .trace.json a Chrome trace, anything else JSON")
+    return parser.parse_args()
+
 if __name__ == "__main__":
+    args = parse_args()
+    # Instrument before the window is built so its event bindings go through the timing wrappers
+    telemetry.enable(args.profile, args.profile_format)
     root = tk.Tk()
-    app = BboxCoordinatesPicker(root)
-    root.mainloop()
\ No newline at end of file
+    app = BboxCoordinatesPicker(root, preview_resample=FILTERS[args.preview_filter], final_resample=FILTERS[args.final_filter], refine_delay=args.refine_delay, memory_budget=args.memory_budget << 20)
+    root.mainloop()
@@ -0,0 +1,137 @@
+import math
+from PIL import Image, ImageTk
+
+TILE_SIZE = 256
+
+def pyramid_mode(image):
+    """Mode pyramid levels are kept in: L, RGB or RGBA, whichever loses nothing for this image."""
+    if image.mode in ("L", "RGB", "RGBA"): return image.mode
+    return "RGBA" if "A" in image.mode or "transparency" in image.info else "RGB"
+
+class TilePyramid:
+    """Multi-resolution pyramid of an image. Level k is the source reduced by 2**k."""
+    def __init__(self, image, tile_size=TILE_SIZE):
+        if image.mode != pyramid_mode(image):
+            image = image.convert(pyramid_mode(image))
+        self.size = image.size
+        self.tile_size = tile_size
+        self.levels = [image]
+        # Stop reducing once the whole image fits in a single tile
+        self.max_level = max(0, math.ceil(math.log2(max(max(self.size), 1) / tile_size)))
+
+    def level(self, k):
+        """Return the image for level k, building coarser levels on first use."""
+        while len(self.levels) <= k:
+            self.levels.append(self.levels[-1].reduce(2))
+        return self.levels[k]
+
+    def level_for_zoom(self, zoom):
+        """Pick the coarsest level that still has at least as many pixels as the screen needs."""
+        if zoom >= 1.0: return 0
+        return min(self.max_level, int(math.floor(-math.log2(zoom))))
+
+    def nbytes(self):
+        """Memory held by the decoded levels."""
+        return sum(level.width * level.height * len(level.getbands()) for level in self.levels)
+
+    def scaled_size(self, zoom):
+        return int(self.size[0] * zoom), int(self.size[1] * zoom)
+
+    def grid_size(self, zoom):
+        """Number of screen tile columns and rows covering the image at this zoom."""
+        scaled_w, scaled_h = self.scaled_size(zoom)
+        ts = self.tile_size
+        return -(-scaled_w // ts), -(-scaled_h // ts)
+
+    def visible_range(self, zoom, x, y, width, height):
+        """Inclusive column and row ranges of the tiles crossing a width x height view with the image's top-left corner at (x, y)."""
+        ts = self.tile_size
+        cols, rows = self.grid_size(zoom)
+        c0 = max(0, int(math.floor(-x / ts)))
+        r0 = max(0, int(math.floor(-y / ts)))
+        c1 = min(cols - 1, int(math.floor((width - x - 1) / ts)))
+        r1 = min(rows - 1, int(math.floor((height - y - 1) / ts)))
+        return c0, c1, r0, r1
+
+    def render_tile(self, zoom, col, row, resample=Image.Resampling.LANCZOS):
+        """Render screen tile (col, row) of the image scaled by zoom. Only the tile's source region is resampled."""
+        ts = self.tile_size
+        scaled_w, scaled_h = self.scaled_size(zoom)
+        x0, y0 = col * ts, row * ts
+        w, h = min(ts, scaled_w - x0), min(ts, scaled_h - y0)
+        if w <= 0 or h <= 0: return None
+
+        k = self.level_for_zoom(zoom)
+        src = self.level(k)
+        # Screen pixels per level pixel, measured on the real level size to absorb rounding from reduce()
+        sx = scaled_w / src.size[0]
+        sy = scaled_h / src.size[1]
+        box = (x0 / sx, y0 / sy, (x0 + w) / sx, (y0 + h) / sy)
+        return src.resize((w, h), resample, box=box)
+
+class TiledCanvasRenderer:
+    """Keeps the visible tiles of a TilePyramid on a Tk canvas.
+
+    Only tiles crossing the canvas are rendered. A pan moves the existing tile
+    items and renders just the tiles that scrolled into view, so the cost of a
+    frame depends on the canvas size rather than the image size or zoom.
+    photo_factory turns a rendered tile into the image given to the canvas;
+    with a stand-in canvas and factory the same code runs without a display.
+    """
+    def __init__(self, canvas, tag="image", tile_size=TILE_SIZE, photo_factory=ImageTk.PhotoImage):
+        self.canvas = canvas
+        self.tag = tag
+        self.tile_size = tile_size
+        self.photo_factory = photo_factory
+        self.pyramid = None
+        self.tiles = {} # (col, row) -> (item_id, PhotoImage, resample)
+        self.zoom = None
+        self.origin = (0, 0)
+
+    def set_pyramid(self, pyramid):
+        """Show a pyramid built elsewhere, e.g. by a background prefetcher."""
+        self.clear()
+        self.pyramid = pyramid
+
+    def clear(self):
+        self.canvas.delete(self.tag)
+        self.tiles = {}
+        self.zoom = None
+
+    def visible_range(self, zoom, x, y):
+        """Inclusive column and row ranges of tiles crossing the canvas."""
+        return self.pyramid.visible_range(zoom, x, y, self.canvas.winfo_width(), self.canvas.winfo_height())
+
+    def render(self, zoom, x, y, resample=Image.Resampling.LANCZOS):
+        """Show the image scaled by zoom with its top-left corner at canvas position (x, y)."""
+        if not self.pyramid: return
+        if zoom != self.zoom:
+            self.clear()
+            self.zoom = zoom
+        elif (x, y) != self.origin:
+            self.canvas.move(self.tag, x - self.origin[0], y - self.origin[1])
+        self.origin = (x, y)
+
+        c0, c1, r0, r1 = self.visible_range(zoom, x, y)
+        for key in [key for key in self.tiles if not (c0 <= key[0] <= c1 and r0 <= key[1] <= r1)]:
+            self.canvas.delete(self.tiles.pop(key)[0])
+
+        ts = self.tile_size
+        for row in range(r0, r1 + 1):
+            for col in range(c0, c1 + 1):
+                if (col, row) in self.tiles: continue
+                tile = self.pyramid.render_tile(zoom, col, row, resample)
+                if tile is None: continue
+                photo = self.photo_factory(tile)
+                item_id = self.canvas.create_image(x + col * ts, y + row * ts, anchor="nw", image=photo, tags=self.tag)
+                self.tiles[(col, row)] = (item_id, photo, resample)
+        self.canvas.tag_lower(self.tag)
+
+    def refine(self, resample=Image.Resampling.LANCZOS):
+        """Re-render the tiles drawn with a different filter, swapping the image of each existing item in place."""
+        if not self.pyramid or self.zoom is None: return
+        for key, (item_id, photo, tile_resample) in list(self.tiles.items()):
+            if tile_resample == resample: continue
+            photo = self.photo_factory(self.pyramid.render_tile(self.zoom, key[0], key[1], resample))
+            self.canvas.itemconfig(item_id, image=photo)
+            self.tiles[key] = (item_id, photo, resample)
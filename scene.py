@@ -0,0 +1,183 @@
+import math
+from store import image_to_canvas
+from geometry import simplify_polygon
+
+NORMAL_COLOR = "red"
+SELECTED_COLOR = "cyan"
+LABEL_OFFSET = 10
+VIEW_MARGIN = 32 # canvas pixels kept around the viewport so labels above a box stay drawn
+LOD_TOLERANCE = 1.0 # max screen-pixel error allowed when decimating polygon outlines
+MARKER_SIZE = 3 # annotations smaller than this on screen are drawn as a marker
+LOD_BUCKETS_PER_OCTAVE = 2
+SIMPLIFY_MIN_POINTS = 32 # outlines with this many vertices or fewer are drawn as they are
+
+def zoom_bucket(zoom):
+    return math.floor(math.log2(zoom) * LOD_BUCKETS_PER_OCTAVE)
+
+class AnnotationLayer:
+    """Retained canvas items for the annotations in view, keyed by annotation id.
+
+    Items are created once per annotation and then updated in place: a
+    selection change recolors only the shapes whose state changed, an add or
+    delete touches one annotation, and a view change moves or re-coords the
+    existing items. Annotations outside the viewport (found through the
+    spatial index) have no canvas items at all. Geometry is read straight
+    from the AnnotationStore.
+
+    Polygons are drawn at a level of detail that matches the zoom: outlines
+    with more than SIMPLIFY_MIN_POINTS vertices are decimated with
+    Douglas-Peucker to within LOD_TOLERANCE screen pixels (cached per zoom
+    bucket), and anything smaller than MARKER_SIZE on screen collapses to a
+    single marker without a label.
+    """
+    def __init__(self, canvas, store, index, tag="annotation"):
+        self.canvas = canvas
+        self.store = store
+        self.index = index
+        self.tag = tag
+        self.items = {} # ann_id -> (shape_id, label_id or None, kind)
+        self.item_count = 0 # canvas items in self.items, shapes and labels
+        self.selected_ids = set()
+        self.lod_cache = {} # ann_id -> {zoom bucket: simplified image-space outline}
+        self.zoom, self.x, self.y = 1.0, 0, 0
+
+    def viewport(self):
+        """Image-space rectangle currently visible on the canvas, padded by VIEW_MARGIN."""
+        zoom = self.zoom
+        pad = VIEW_MARGIN / zoom
+        width, height = self.canvas.winfo_width(), self.canvas.winfo_height()
+        return -self.x / zoom - pad, -self.y / zoom - pad, (width - self.x) / zoom + pad, (height - self.y) / zoom + pad
+
+    def visible_ids(self):
+        return self.index.query_rect(*self.viewport())
+
+    def _outline(self, ann_id, i):
+        """Polygon outline decimated for the current zoom bucket."""
+        points = self.store.points(i)
+        # Decimating a short outline costs more than drawing every vertex
+        if len(points) <= SIMPLIFY_MIN_POINTS: return points
+        bucket = zoom_bucket(self.zoom)
+        outlines = self.lod_cache.setdefault(ann_id, {})
+        outline = outlines.get(bucket)
+        if outline is None:
+            # Tolerance for the most zoomed-in end of the bucket, so the error stays under LOD_TOLERANCE across it
+            tolerance = LOD_TOLERANCE / 2 ** ((bucket + 1) / LOD_BUCKETS_PER_OCTAVE)
+            outline = outlines[bucket] = simplify_polygon(points, tolerance)
+        return outline
+
+    def _geometry(self, ann_id, i):
+        """Item kind and canvas coordinates for an annotation at the current view."""
+        xmin, ymin, xmax, ymax = self.index.bboxes[ann_id]
+        if max(xmax - xmin, ymax - ymin) * self.zoom < MARKER_SIZE:
+            cx, cy = self.x + (xmin + xmax) / 2 * self.zoom, self.y + (ymin + ymax) / 2 * self.zoom
+            r = MARKER_SIZE / 2
+            return "marker", [cx - r, cy - r, cx + r, cy + r]
+        if self.store.type_name(i) == "BBox":
+            return "BBox", image_to_canvas(self.store.points(i), self.zoom, self.x, self.y).ravel().tolist()
+        return "Polygon", image_to_canvas(self._outline(ann_id, i), self.zoom, self.x, self.y).ravel().tolist()
+
+    def _create(self, ann_id, i):
+        store = self.store
+        if store.type_name(i) == "Polygon" and len(store.points(i)) < 2: return
+        color = SELECTED_COLOR if ann_id in self.selected_ids else NORMAL_COLOR
+        kind, coords = self._geometry(ann_id, i)
+        tags = (self.tag, f"ann_{ann_id}")
+        label_id = None
+        if kind == "marker":
+            shape_id = self.canvas.create_rectangle(*coords, outline=color, fill=color, tags=tags)
+        else:
+            if kind == "BBox":
+                shape_id = self.canvas.create_rectangle(*coords, outline=color, width=2, tags=tags)
+            else:
+                shape_id = self.canvas.create_polygon(*coords, outline=color, fill="", width=2, tags=tags)
+            label_id = self.canvas.create_text(coords[0], coords[1] - LABEL_OFFSET, text=store.label(i), fill="white", anchor="sw", tags=(self.tag, f"label_{ann_id}"))
+        self.items[ann_id] = (shape_id, label_id, kind)
+        self.item_count += 1 if label_id is None else 2
+
+    def _create_many(self, ann_ids):
+        ann_ids = list(ann_ids)
+        for ann_id, i in zip(ann_ids, self.store.indices_of(ann_ids)):
+            self._create(ann_id, i)
+
+    def _delete_items(self, ann_id):
+        shape_id, label_id, kind = self.items.pop(ann_id)
+        self.item_count -= 1 if label_id is None else 2
+        self.canvas.delete(shape_id)
+        if label_id is not None: self.canvas.delete(label_id)
+
+    def add(self, ann_id):
+        """Create the items for one annotation if it is in view. It must already be in the store and the index."""
+        xmin, ymin, xmax, ymax = self.index.bboxes[ann_id]
+        vx1, vy1, vx2, vy2 = self.viewport()
+        if xmin <= vx2 and xmax >= vx1 and ymin <= vy2 and ymax >= vy1:
+            self._create(ann_id, self.store.index_of(ann_id))
+
+    def remove(self, ann_id):
+        if ann_id in self.items:
+            self._delete_items(ann_id)
+        self.invalidate(ann_id)
+        self.selected_ids.discard(ann_id)
+
+    def update_label(self, ann_id):
+        """Show an annotation's current label after a relabel."""
+        item = self.items.get(ann_id)
+        if item and item[1] is not None:
+            self.canvas.itemconfig(item[1], text=self.store.label(self.store.index_of(ann_id)))
+
+    def invalidate(self, ann_id):
+        """Drop cached outlines after an annotation's geometry changed."""
+        self.lod_cache.pop(ann_id, None)
+
+    def clear(self):
+        self.canvas.delete(self.tag)
+        self.items = {}
+        self.item_count = 0
+        self.selected_ids = set()
+        self.lod_cache = {}
+
+    def rebuild(self):
+        self.canvas.delete(self.tag)
+        self.items = {}
+        self.item_count = 0
+        self._create_many(self.visible_ids())
+
+    def set_selected(self, ann_ids):
+        """Highlight exactly ann_ids, recoloring only the shapes whose state changes."""
+        ann_ids = set(ann_ids)
+        for ann_id in self.selected_ids ^ ann_ids:
+            if ann_id in self.items:
+                shape_id, label_id, kind = self.items[ann_id]
+                color = SELECTED_COLOR if ann_id in ann_ids else NORMAL_COLOR
+                if kind == "marker":
+                    self.canvas.itemconfig(shape_id, outline=color, fill=color)
+                else:
+                    self.canvas.itemconfig(shape_id, outline=color)
+        self.selected_ids = ann_ids
+
+    def set_view(self, zoom, x, y):
+        """Follow a pan or zoom. A pan is a single canvas move; a zoom updates coordinates in place."""
+        pan_only = zoom == self.zoom
+        dx, dy = x - self.x, y - self.y
+        self.zoom, self.x, self.y = zoom, x, y
+
+        visible = self.visible_ids()
+        for ann_id in [ann_id for ann_id in self.items if ann_id not in visible]:
+            self._delete_items(ann_id)
+
+        if pan_only:
+            if dx or dy: self.canvas.move(self.tag, dx, dy)
+        elif self.items:
+            retained = list(self.items)
+            for ann_id, i in zip(retained, self.store.indices_of(retained)):
+                shape_id, label_id, kind = self.items[ann_id]
+                new_kind, coords = self._geometry(ann_id, i)
+                if new_kind != kind:
+                    # Crossed the marker threshold: the item type changes, so recreate it
+                    self._delete_items(ann_id)
+                    self._create(ann_id, i)
+                    continue
+                self.canvas.coords(shape_id, coords)
+                if label_id is not None:
+                    self.canvas.coords(label_id, coords[0], coords[1] - LABEL_OFFSET)
+
+        self._create_many([ann_id for ann_id in visible if ann_id not in self.items])
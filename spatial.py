@@ -0,0 +1,124 @@
+import math
+import numpy as np
+from collections import defaultdict
+from store import BBOX
+
+class GridIndex:
+    """Uniform grid over image space, mapping each cell to the ids whose bounding box overlaps it.
+
+    Queries only visit the cells under the query point or rectangle, so their
+    cost depends on the local annotation density rather than the total count.
+    """
+    def __init__(self, cell_size=256):
+        self.cell_size = cell_size
+        self.cells = defaultdict(set)
+        self.bboxes = {} # id -> (xmin, ymin, xmax, ymax)
+
+    def __len__(self):
+        return len(self.bboxes)
+
+    def _cell_range(self, xmin, ymin, xmax, ymax):
+        cs = self.cell_size
+        return range(int(xmin // cs), int(xmax // cs) + 1), range(int(ymin // cs), int(ymax // cs) + 1)
+
+    def insert(self, item_id, bbox):
+        if item_id in self.bboxes: self.remove(item_id)
+        self.bboxes[item_id] = bbox
+        cols, rows = self._cell_range(*bbox)
+        for cx in cols:
+            for cy in rows:
+                self.cells[(cx, cy)].add(item_id)
+
+    def remove(self, item_id):
+        bbox = self.bboxes.pop(item_id, None)
+        if bbox is None: return
+        cols, rows = self._cell_range(*bbox)
+        for cx in cols:
+            for cy in rows:
+                cell = self.cells.get((cx, cy))
+                if cell is None: continue
+                cell.discard(item_id)
+                if not cell: del self.cells[(cx, cy)]
+
+    def insert_many(self, item_ids, bboxes):
+        for item_id, bbox in zip(item_ids, bboxes):
+            self.insert(item_id, tuple(bbox))
+
+    def clear(self):
+        self.cells.clear()
+        self.bboxes.clear()
+
+    def query_point(self, x, y, tolerance=0):
+        """Ids whose bounding box, grown by tolerance, contains (x, y)."""
+        return self.query_rect(x - tolerance, y - tolerance, x + tolerance, y + tolerance)
+
+    def query_rect(self, xmin, ymin, xmax, ymax):
+        """Ids whose bounding box intersects the rectangle."""
+        cols, rows = self._cell_range(xmin, ymin, xmax, ymax)
+        if len(cols) * len(rows) > len(self.cells):
+            # Rectangle covers more cells than are occupied: scan the occupied ones instead
+            candidates = set().union(*(ids for (cx, cy), ids in self.cells.items() if cx in cols and cy in rows))
+        else:
+            candidates = set()
+            for cx in cols:
+                for cy in rows:
+                    cell = self.cells.get((cx, cy))
+                    if cell: candidates |= cell
+        bboxes = self.bboxes
+        return {i for i in candidates if bboxes[i][0] <= xmax and bboxes[i][2] >= xmin and bboxes[i][1] <= ymax and bboxes[i][3] >= ymin}
+
+    def hit_test(self, x, y, store, tolerance=0, interior=True):
+        """Id of the smallest annotation of an AnnotationStore at (x, y), or None.
+
+        A point hits an annotation when it lies within tolerance of its
+        outline, or anywhere inside it if interior is set. Boxes are tested
+        with scalar comparisons on their indexed bounding box; the candidate
+        polygons are tested together, with one pass of array operations over
+        their gathered vertices, so the cost no longer grows by a dozen NumPy
+        calls per candidate.
+        """
+        candidates = list(self.query_point(x, y, tolerance))
+        if not candidates: return None
+        best_id, best_area = None, math.inf
+        polygons = []
+        for item_id, type_code in zip(candidates, store.types[store.indices_of(candidates)].tolist()):
+            if type_code != BBOX:
+                polygons.append(item_id)
+                continue
+            xmin, ymin, xmax, ymax = self.bboxes[item_id]
+            # Signed distances past the box's sides: both are <= 0 inside it
+            dx, dy = max(xmin - x, x - xmax), max(ymin - y, y - ymax)
+            if dx > 0 or dy > 0:
+                hit = math.hypot(max(dx, 0), max(dy, 0)) <= tolerance
+            else:
+                hit = interior or -max(dx, dy) <= tolerance
+            area = (xmax - xmin) * (ymax - ymin)
+            if hit and area < best_area:
+                best_id, best_area = item_id, area
+        if not polygons: return best_id
+
+        rows = store.indices_of(polygons)
+        offsets, coords = store.offsets, store.coords
+        starts, ends = offsets[rows], offsets[rows + 1]
+        lengths = ends - starts
+        firsts = np.cumsum(lengths) - lengths # where each ring starts among the gathered vertices
+        index = np.arange(lengths.sum()) + np.repeat(starts - firsts, lengths)
+        previous = index - 1
+        previous[firsts] = ends - 1
+        x1, y1 = coords[index, 0], coords[index, 1]
+        x2, y2 = coords[previous, 0], coords[previous, 1]
+        # Distance to the closest point of every edge, reduced to the closest edge of each polygon
+        ex, ey = x1 - x2, y1 - y2
+        length_sq = ex * ex + ey * ey
+        t = np.clip(((x - x2) * ex + (y - y2) * ey) / np.where(length_sq == 0, 1, length_sq), 0, 1)
+        hits = np.minimum.reduceat(np.hypot(x - x2 - ex * t, y - y2 - ey * t), firsts) <= tolerance
+        if interior:
+            # Even-odd ray casting
+            crosses = (y1 > y) != (y2 > y)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                x_at = (x2 - x1) * (y - y1) / (y2 - y1) + x1
+            hits |= np.add.reduceat((crosses & (x < x_at)).astype(np.int64), firsts) % 2 == 1
+        areas = np.where(hits, np.abs(np.add.reduceat(x2 * y1 - x1 * y2, firsts)) / 2, math.inf)
+        k = int(np.argmin(areas))
+        if areas[k] < best_area: best_id = polygons[k]
+        return best_id
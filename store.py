@@ -0,0 +1,259 @@
+import numpy as np
+
+TYPE_NAMES = ("BBox", "Polygon")
+TYPE_CODES = {name: code for code, name in enumerate(TYPE_NAMES)}
+BBOX, POLYGON = TYPE_CODES["BBox"], TYPE_CODES["Polygon"]
+
+def image_to_canvas(coords, zoom, x, y):
+    """Map an (n, 2) array of image coordinates to canvas coordinates."""
+    return coords * zoom + (x, y)
+
+def canvas_to_image(coords, zoom, x, y):
+    """Map an (n, 2) array of canvas coordinates to image coordinates."""
+    return (np.asarray(coords, dtype=np.float64) - (x, y)) / zoom
+
+def to_python(values):
+    """Convert an array to nested Python lists, as ints when every value is integral."""
+    values = np.asarray(values)
+    if values.dtype.kind == "f" and values.size and np.array_equal(values, np.trunc(values)):
+        values = values.astype(np.int64)
+    return values.tolist()
+
+class AnnotationStore:
+    """Columnar storage for the annotations of one image.
+
+    All vertices live in one flat (n_points, 2) coordinate buffer and
+    annotation i owns rows offsets[i]:offsets[i + 1]. Labels are interned to
+    integer ids and types are stored as small integer codes, so geometry
+    (bounding boxes, areas, view transforms) is computed for every
+    annotation at once with a handful of array operations. BBox annotations
+    store their two corners (min, max). Buffers grow by doubling, so append
+    is amortized O(points added); ids are handed out in increasing order and
+    row order is preserved, which keeps id lookup a binary search. version
+    increases on every mutation, so callers can tell whether a store changed.
+    """
+    def __init__(self):
+        self._coords = np.empty((256, 2), dtype=np.float64)
+        self._offsets = np.zeros(65, dtype=np.int64)
+        self._ids = np.empty(64, dtype=np.int64)
+        self._label_ids = np.empty(64, dtype=np.int32)
+        self._types = np.empty(64, dtype=np.int8)
+        self._count = 0
+        self.labels = [] # label id -> name
+        self._label_codes = {} # name -> label id
+        self.next_id = 0
+        self.version = 0
+
+    @classmethod
+    def from_dicts(cls, annotations):
+        """Build a store from {"type", "label", "points"} dicts."""
+        store = cls()
+        for ann in annotations:
+            store.append(ann["type"], ann["label"], ann["points"])
+        return store
+
+    def __len__(self):
+        return self._count
+
+    def copy(self):
+        """An independent store with the same annotations, e.g. to serialize on another thread."""
+        store = AnnotationStore()
+        n = self._count
+        store._coords, store._offsets = self.coords.copy(), self.offsets.copy()
+        store._ids, store._label_ids, store._types = self.ids.copy(), self.label_ids.copy(), self.types.copy()
+        store._count = n
+        store.labels, store._label_codes = list(self.labels), dict(self._label_codes)
+        store.next_id, store.version = self.next_id, self.version
+        return store
+
+    def __iter__(self):
+        return (self.get(i) for i in range(self._count))
+
+    # --- Column views ---
+    @property
+    def ids(self): return self._ids[:self._count]
+    @property
+    def label_ids(self): return self._label_ids[:self._count]
+    @property
+    def types(self): return self._types[:self._count]
+    @property
+    def offsets(self): return self._offsets[:self._count + 1]
+    @property
+    def coords(self): return self._coords[:self._offsets[self._count]]
+
+    def label_id(self, label):
+        """Intern a label name and return its id."""
+        code = self._label_codes.get(label)
+        if code is None:
+            code = self._label_codes[label] = len(self.labels)
+            self.labels.append(label)
+        return code
+
+    def used_labels(self):
+        """Sorted names of the labels that at least one annotation uses."""
+        return sorted(self.labels[i] for i in np.unique(self.label_ids))
+
+    def label(self, i): return self.labels[self._label_ids[i]]
+    def type_name(self, i): return TYPE_NAMES[self._types[i]]
+    def points(self, i): return self._coords[self._offsets[i]:self._offsets[i + 1]]
+
+    def get(self, i):
+        """Annotation i as a plain dict, the shape the rest of the app used before the store."""
+        return {"id": int(self._ids[i]), "type": self.type_name(i), "label": self.label(i), "points": [tuple(p) for p in to_python(self.points(i))]}
+
+    # --- Mutation ---
+    def _reserve(self, rows, points):
+        if self._count + rows > len(self._ids):
+            capacity = max(len(self._ids) * 2, self._count + rows)
+            for name in ("_ids", "_label_ids", "_types"):
+                old = getattr(self, name)
+                new = np.empty(capacity, dtype=old.dtype)
+                new[:self._count] = old[:self._count]
+                setattr(self, name, new)
+            offsets = np.zeros(capacity + 1, dtype=np.int64)
+            offsets[:self._count + 1] = self._offsets[:self._count + 1]
+            self._offsets = offsets
+        n_points = self._offsets[self._count]
+        if n_points + points > len(self._coords):
+            coords = np.empty((max(len(self._coords) * 2, n_points + points), 2), dtype=np.float64)
+            coords[:n_points] = self._coords[:n_points]
+            self._coords = coords
+
+    def append(self, ann_type, label, points, ann_id=None):
+        """Add one annotation and return its id."""
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        if ann_id is None:
+            ann_id = self.next_id
+        elif self._count and ann_id <= self._ids[self._count - 1]:
+            raise ValueError("annotation ids must be increasing")
+        self.next_id = max(self.next_id, ann_id + 1)
+        self._reserve(1, len(points))
+        i = self._count
+        start = self._offsets[i]
+        self._coords[start:start + len(points)] = points
+        self._offsets[i + 1] = start + len(points)
+        self._ids[i] = ann_id
+        self._label_ids[i] = self.label_id(label)
+        self._types[i] = TYPE_CODES[ann_type]
+        self._count += 1
+        self.version += 1
+        return ann_id
+
+    def delete(self, indices):
+        """Remove the annotations at the given row indices.
+
+        Each run of rows between two deleted ones is moved down with one slice
+        copy per column, so a delete costs a memmove of the rows after the
+        first deleted one rather than a rebuild of every column.
+        """
+        indices = np.unique(np.asarray(indices, dtype=np.int64))
+        if not indices.size: return
+        offsets, n = self._offsets, self._count
+        row, point = int(indices[0]), int(offsets[indices[0]]) # where the next kept run goes
+        for start, end in zip((indices + 1).tolist(), indices[1:].tolist() + [n]):
+            if start == end: continue
+            rows, p0, p1 = end - start, int(offsets[start]), int(offsets[end])
+            self._coords[point:point + p1 - p0] = self._coords[p0:p1]
+            for name in ("_ids", "_label_ids", "_types"):
+                column = getattr(self, name)
+                column[row:row + rows] = column[start:end]
+            offsets[row + 1:row + rows + 1] = offsets[start + 1:end + 1] - (p0 - point)
+            row, point = row + rows, point + p1 - p0
+        self._count = row
+        self.version += 1
+
+    def set_label(self, indices, label):
+        self._label_ids[np.asarray(indices, dtype=np.int64)] = self.label_id(label)
+        self.version += 1
+
+    def translate(self, i, dx, dy):
+        self.points(i)[:] += (dx, dy)
+        self.version += 1
+
+    def set_points(self, i, points):
+        """Replace annotation i's vertices with the same number of new ones."""
+        self.points(i)[:] = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        self.version += 1
+
+    # --- Lookup ---
+    def index_of(self, ann_id):
+        """Row index of an annotation id, or -1."""
+        i = int(np.searchsorted(self.ids, ann_id))
+        return i if i < self._count and self._ids[i] == ann_id else -1
+
+    def indices_of(self, ann_ids):
+        """Row indices of several ids at once. All ids must be present."""
+        return np.searchsorted(self.ids, np.fromiter(ann_ids, dtype=np.int64))
+
+    # --- Vectorized geometry ---
+    def bbox(self, i):
+        points = self.points(i)
+        return (*points.min(axis=0).tolist(), *points.max(axis=0).tolist())
+
+    def bboxes(self):
+        """(n, 4) array of xmin, ymin, xmax, ymax for every annotation."""
+        if not self._count: return np.empty((0, 4))
+        coords, starts = self.coords, self.offsets[:-1]
+        return np.column_stack((
+            np.minimum.reduceat(coords[:, 0], starts), np.minimum.reduceat(coords[:, 1], starts),
+            np.maximum.reduceat(coords[:, 0], starts), np.maximum.reduceat(coords[:, 1], starts)))
+
+    def areas(self):
+        """Area of every annotation: box area for BBoxes, shoelace area for polygons."""
+        if not self._count: return np.empty(0)
+        coords, offsets = self.coords, self.offsets
+        # Index of the next vertex within each ring, wrapping the last vertex back to the first
+        following = np.arange(1, len(coords) + 1)
+        following[offsets[1:] - 1] = offsets[:-1]
+        x, y = coords[:, 0], coords[:, 1]
+        cross = x * y[following] - x[following] * y
+        areas = np.abs(np.add.reduceat(cross, offsets[:-1])) / 2
+        boxes = self.types == BBOX
+        if boxes.any():
+            bboxes = self.bboxes()[boxes]
+            areas[boxes] = (bboxes[:, 2] - bboxes[:, 0]) * (bboxes[:, 3] - bboxes[:, 1])
+        return areas
+
+    def to_canvas(self, zoom, x, y):
+        """All vertices mapped to canvas space, aligned with coords."""
+        return image_to_canvas(self.coords, zoom, x, y)
+
+class LabelIndex:
+    """Annotation ids grouped by label name.
+
+    Kept in step with a store through insert, remove and relabel as edits
+    happen, so filtering by a label or counting its instances never scans
+    the store.
+    """
+    def __init__(self):
+        self.ids = {} # label -> set of annotation ids
+
+    def rebuild(self, store):
+        self.ids = {}
+        labels = store.labels
+        for ann_id, label_id in zip(store.ids.tolist(), store.label_ids.tolist()):
+            self.insert(ann_id, labels[label_id])
+
+    def insert(self, ann_id, label):
+        self.ids.setdefault(label, set()).add(ann_id)
+
+    def remove(self, ann_id, label):
+        ids = self.ids.get(label)
+        if ids is None: return
+        ids.discard(ann_id)
+        if not ids: del self.ids[label]
+
+    def relabel(self, ann_id, old_label, label):
+        self.remove(ann_id, old_label)
+        self.insert(ann_id, label)
+
+    def count(self, label):
+        return len(self.ids.get(label, ()))
+
+    def counts(self):
+        """{label: number of annotations}, sorted by label."""
+        return {label: len(self.ids[label]) for label in sorted(self.ids)}
+
+    def ids_of(self, label):
+        """Ids carrying label, in store row order."""
+        return np.array(sorted(self.ids.get(label, ())), dtype=np.int64)
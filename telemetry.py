@@ -0,0 +1,157 @@
+import os
+import csv
+import json
+import time
+import atexit
+import threading
+import functools
+from array import array
+from collections import defaultdict, deque
+import numpy as np
+from dataset import atomic_file
+
+PROFILE_ENV = "ANNOTATOR_PROFILE" # report path; profiling is off when unset
+PROFILE_FORMAT_ENV = "ANNOTATOR_PROFILE_FORMAT"
+FORMATS = ("json", "csv", "chrome")
+MAX_TRACE_EVENTS = 1_000_000 # newest events kept for the Chrome trace
+# Upper bounds of the latency histogram buckets, in ms; the last bucket is open-ended
+HISTOGRAM_BOUNDS = (0.1, 0.5, 1, 2, 4, 8, 16, 33, 50, 100, 250, 500, 1000, 5000)
+
+def report_format(path, fmt=None):
+    """The report format named by fmt, or guessed from the file name."""
+    if fmt: return fmt
+    if path.endswith(".csv"): return "csv"
+    if path.endswith((".trace.json", ".trace")): return "chrome"
+    return "json"
+
+def _summary(values):
+    values = np.frombuffer(values, dtype=np.float64)
+    p50, p90, p99 = np.percentile(values, (50, 90, 99))
+    return {"count": len(values), "total": float(values.sum()), "mean": float(values.mean()), "min": float(values.min()),
+            "p50": float(p50), "p90": float(p90), "p99": float(p99), "max": float(values.max())}
+
+class Profiler:
+    """Per-call latency and gauge recorder for the application's hot paths.
+
+    Nothing is measured until instrument() replaces a function or method
+    with a timing wrapper, so a run without a profiler pays nothing at all.
+    Each call adds its duration to the call's samples (summarized as
+    percentiles and a latency histogram) and, for the Chrome trace, a
+    complete event. gauges(result, *args) can return values such as canvas
+    item counts or decoded image sizes, sampled after every call.
+    write() saves the report as JSON, CSV or a Chrome trace
+    (chrome://tracing, Perfetto).
+    """
+    def __init__(self, path, fmt=None, max_events=MAX_TRACE_EVENTS):
+        self.path = path
+        self.format = report_format(path, fmt)
+        if self.format not in FORMATS: raise ValueError(f"Unsupported profile format: {self.format}")
+        self.started = time.time()
+        self.origin = time.perf_counter_ns()
+        self.durations = defaultdict(lambda: array("d")) # name -> ms per call
+        self.gauges = defaultdict(lambda: array("d")) # name -> sampled values
+        self.events = deque(maxlen=max_events)
+        self.pid = os.getpid()
+
+    # --- Recording ---
+    def instrument(self, owner, attr, name=None, gauges=None):
+        """Time every call of owner.attr (a class or module attribute) under name."""
+        func = getattr(owner, attr)
+        name = name or attr
+        durations = self.durations[name]
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter_ns()
+            try:
+                result = func(*args, **kwargs)
+            finally:
+                end = time.perf_counter_ns()
+                durations.append((end - start) / 1e6)
+                self.events.append(("X", name, start, end - start, threading.get_ident()))
+            if gauges:
+                for gauge, value in gauges(result, *args).items():
+                    self.gauge(gauge, value, end)
+            return result
+
+        setattr(owner, attr, wrapper)
+
+    def gauge(self, name, value, timestamp=None):
+        self.gauges[name].append(value)
+        self.events.append(("C", name, timestamp or time.perf_counter_ns(), value, threading.get_ident()))
+
+    # --- Reports ---
+    def report(self):
+        calls = {}
+        for name, values in list(self.durations.items()):
+            if not values: continue
+            calls[name] = _summary(values)
+            counts = np.bincount(np.searchsorted(HISTOGRAM_BOUNDS, np.frombuffer(values, dtype=np.float64)), minlength=len(HISTOGRAM_BOUNDS) + 1)
+            calls[name]["histogram"] = dict(zip(self._bucket_names(), counts.tolist()))
+        gauges = {name: _summary(values) for name, values in list(self.gauges.items()) if values}
+        return {"started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started)), "duration_s": (time.perf_counter_ns() - self.origin) / 1e9,
+                "unit": "ms", "calls": calls, "gauges": gauges}
+
+    @staticmethod
+    def _bucket_names():
+        return [f"<={bound}ms" for bound in HISTOGRAM_BOUNDS] + [f">{HISTOGRAM_BOUNDS[-1]}ms"]
+
+    def chrome_trace(self):
+        events = []
+        for kind, name, start, value, tid in list(self.events):
+            ts = (start - self.origin) / 1e3
+            if kind == "X":
+                events.append({"name": name, "ph": "X", "ts": ts, "dur": value / 1e3, "pid": self.pid, "tid": tid})
+            else:
+                events.append({"name": name, "ph": "C", "ts": ts, "pid": self.pid, "args": {name: value}})
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write(self):
+        if self.format == "csv":
+            report = self.report()
+            columns = ["count", "total", "mean", "min", "p50", "p90", "p99", "max"]
+            with atomic_file(self.path, "w") as f:
+                writer = csv.writer(f)
+                writer.writerow(["kind", "name"] + columns + self._bucket_names())
+                for name, stats in report["calls"].items():
+                    writer.writerow(["call", name] + [stats[c] for c in columns] + list(stats["histogram"].values()))
+                for name, stats in report["gauges"].items():
+                    writer.writerow(["gauge", name] + [stats[c] for c in columns])
+            return
+        payload = self.chrome_trace() if self.format == "chrome" else self.report()
+        with atomic_file(self.path, "w") as f:
+            json.dump(payload, f, indent=None if self.format == "chrome" else 2)
+
+# --- Application hot paths ---
+def _canvas_items(picker):
+    """Annotation and image tile items on the canvas, from the counts the layers keep; canvas.find_all() would list every item."""
+    return picker.layer.item_count + len(picker.renderer.tiles)
+
+def instrument_app(profiler):
+    """Wrap the annotator's rendering, input and I/O paths. Call before the window is built, so Tk bindings pick up the wrappers."""
+    import app, render, loader, scene
+    picker = app.BboxCoordinatesPicker
+    profiler.instrument(app.FrameScheduler, "flush", "frame")
+    profiler.instrument(picker, "display_image", gauges=lambda result, self, *args: {"canvas_items": _canvas_items(self), "image_tiles": len(self.renderer.tiles)})
+    profiler.instrument(picker, "redraw_annotations", gauges=lambda result, self, *args: {"canvas_items": _canvas_items(self)})
+    profiler.instrument(picker, "on_zoom")
+    profiler.instrument(picker, "on_pan_move")
+    image_pixels = lambda result, self, *args: {"image_pixels": self.pyramid.size[0] * self.pyramid.size[1]} if self.pyramid else {}
+    profiler.instrument(picker, "load_image", gauges=image_pixels)
+    profiler.instrument(picker, "show_session_image", gauges=image_pixels)
+    profiler.instrument(app, "save_annotations", gauges=lambda result, fmt, file_path, store, *args: {"saved_annotations": len(store)})
+    # Tile rendering: resize alone, then resize plus PhotoImage and canvas work
+    profiler.instrument(render.TilePyramid, "render_tile", "resize_tile")
+    profiler.instrument(render.TiledCanvasRenderer, "render", "render_tiles")
+    profiler.instrument(render.TiledCanvasRenderer, "refine", "refine_tiles")
+    profiler.instrument(scene.AnnotationLayer, "set_view", "annotation_view", gauges=lambda result, self, *args: {"annotation_items": len(self.items)})
+    profiler.instrument(loader.LazyPyramid, "_decode", "decode_image", gauges=lambda image, *args: {"decoded_pixels": image.size[0] * image.size[1], "decoded_bytes": image.size[0] * image.size[1] * len(image.getbands())})
+
+def enable(path=None, fmt=None):
+    """Instrument the app and write the report at exit. path defaults to $ANNOTATOR_PROFILE; returns None when neither is set."""
+    path = path or os.environ.get(PROFILE_ENV)
+    if not path: return None
+    profiler = Profiler(path, fmt or os.environ.get(PROFILE_FORMAT_ENV))
+    instrument_app(profiler)
+    atexit.register(profiler.write)
+    return profiler
@@ -0,0 +1,19 @@
+import io
+import json
+import batch
+from dataset import write_annotation_file, annotation_path
+from store import AnnotationStore
+
+def test_images_sharing_an_output_name_are_reported_instead_of_overwritten(tmp_path):
+    for name, count in (("a.jpg", 1), ("a.png", 2), ("b.jpg", 3)):
+        store = AnnotationStore()
+        for k in range(count):
+            store.append("BBox", "car", [(k, k), (k + 5, k + 5)])
+        write_annotation_file(annotation_path(str(tmp_path / name)), store, name, (100, 100))
+    out = tmp_path / "out"
+    summary = batch.run(str(tmp_path), str(out), ["yolo"], jobs=1, coco_dataset=str(tmp_path / "all.json"), out=io.StringIO())
+    assert len(summary["errors"]) == 2
+    assert all("a.*" in error for error in summary["errors"])
+    assert sorted(p.name for p in out.iterdir()) == ["b.txt", "classes.txt"]
+    # The dataset-wide file has no per-image names to collide on
+    assert len(json.loads((tmp_path / "all.json").read_text())["annotations"]) == 6
@@ -0,0 +1,98 @@
+import os
+import json
+import errno
+import pytest
+from journal import EditJournal, replay
+from store import AnnotationStore
+from dataset import read_annotation_file
+
+def add_boxes(store, journal, count):
+    for _ in range(count):
+        i = len(store)
+        store.append("BBox", "car", [(i, i), (i + 10, i + 10)])
+        journal.log_add(store, i)
+
+def test_failed_write_is_cut_back_and_retried(tmp_path, monkeypatch):
+    store = AnnotationStore()
+    # A long flush interval keeps the writer thread asleep, so the test flushes by hand
+    journal = EditJournal(str(tmp_path / "a.jpg"), (100, 100), flush_interval=3600)
+    add_boxes(store, journal, 3)
+    real_write = os.write
+
+    def fail_halfway(fd, data):
+        monkeypatch.setattr(os, "write", real_write)
+        real_write(fd, bytes(data[:len(data) // 2]))
+        raise OSError(errno.ENOSPC, "No space left on device")
+
+    monkeypatch.setattr(os, "write", fail_halfway)
+    journal._flush()
+    assert isinstance(journal.error, OSError)
+    add_boxes(store, journal, 2)
+    journal._flush()
+    assert journal.error is None
+
+    with open(journal.path) as f:
+        assert all(json.loads(line)["op"] == "add" for line in f)
+    recovered = AnnotationStore()
+    assert replay(recovered, journal.path) == 5
+    assert recovered.ids.tolist() == store.ids.tolist()
+    journal.close(store)
+
+def test_replay_skips_a_torn_line_and_keeps_the_records_after_it(tmp_path):
+    path = tmp_path / "a.jpg.ann.journal"
+    records = [{"op": "add", "id": i, "type": "BBox", "label": "car", "points": [[i, i], [i + 1, i + 1]]} for i in range(3)]
+    lines = [json.dumps(record) for record in records]
+    path.write_text(lines[0] + "\n" + lines[1][:12] + "\n" + lines[2] + "\n" + lines[1][:5])
+    store = AnnotationStore()
+    assert replay(store, str(path)) == 2
+    assert store.ids.tolist() == [0, 2]
+
+def test_close_snapshots_in_the_background_and_removes_the_journal(tmp_path):
+    image = str(tmp_path / "a.jpg")
+    store = AnnotationStore()
+    journal = EditJournal(image, (100, 100))
+    add_boxes(store, journal, 3)
+    journal.close(store)
+    store.append("BBox", "late", [(0, 0), (1, 1)]) # after close: not in the snapshot
+    journal.wait()
+    assert journal.done and not os.path.exists(journal.path)
+    with open(image + ".ann.json") as f:
+        assert [ann["id"] for ann in json.load(f)["annotations"]] == [0, 1, 2]
+
+def test_failed_final_snapshot_keeps_the_journal_for_recovery(tmp_path):
+    image = str(tmp_path / "a.jpg")
+    os.mkdir(image + ".ann.json") # the snapshot cannot replace a directory
+    store = AnnotationStore()
+    journal = EditJournal(image, (100, 100))
+    add_boxes(store, journal, 2)
+    journal.close(store)
+    with pytest.raises(OSError):
+        journal.wait()
+    os.rmdir(image + ".ann.json")
+    recovered, count = EditJournal.open(image, AnnotationStore(), (100, 100))
+    assert count == 2
+
+def test_edits_left_by_a_crash_are_replayed_over_the_snapshot(tmp_path):
+    image = str(tmp_path / "a.jpg")
+    store = AnnotationStore()
+    journal = EditJournal(image, (100, 100), flush_interval=3600)
+    add_boxes(store, journal, 4)
+    journal.compact(store)
+    store.delete([store.index_of(1)])
+    journal.log_delete(store, {1})
+    store.set_label([store.index_of(2)], "bus")
+    journal.log_relabel(store, {2}, "bus")
+    i = store.index_of(3)
+    store.translate(i, 5, -2)
+    journal.log_move(store, [i])
+    journal._flush() # written, but the app dies before close()
+
+    recovered = read_annotation_file(image + ".ann.json")[0]
+    assert len(recovered) == 4
+    reopened, count = EditJournal.open(image, recovered, (100, 100))
+    assert count == 3
+    assert [recovered.get(i) for i in range(len(recovered))] == [store.get(i) for i in range(len(store))]
+    # The recovered edits are folded into the snapshot before the journal goes
+    assert len(read_annotation_file(image + ".ann.json")[0]) == 3
+    reopened.close(recovered)
+    reopened.wait()
@@ -0,0 +1,91 @@
+import numpy as np
+from store import AnnotationStore
+from spatial import GridIndex
+
+def make_store():
+    store = AnnotationStore()
+    store.append("BBox", "car", [(0, 0), (100, 100)])
+    store.append("Polygon", "tree", [(10, 10), (30, 10), (30, 40), (10, 40), (5, 25)])
+    store.append("BBox", "car", [(20, 20), (40, 40)])
+    store.append("Polygon", "bus", [(200, 200), (260, 200), (230, 250)])
+    store.append("BBox", "tree", [(300, 0), (310, 10)])
+    return store
+
+def indexed(store, cell_size=64):
+    index = GridIndex(cell_size)
+    index.insert_many(store.ids, store.bboxes())
+    return index
+
+def test_delete_keeps_the_other_rows_and_their_vertices():
+    store = make_store()
+    kept = [store.get(i) for i in (1, 3)]
+    store.delete([4, 0, 2, 0])
+    assert len(store) == 2
+    assert [store.get(i) for i in range(len(store))] == kept
+    assert store.offsets.tolist() == [0, 5, 8]
+    assert store.index_of(0) == -1 and store.index_of(3) == 1
+    # Appending after a delete reuses the freed space without touching the kept rows
+    store.append("BBox", "car", [(1, 2), (3, 4)])
+    assert store.ids.tolist() == [1, 3, 5]
+    assert store.get(1) == kept[1]
+
+def test_delete_of_nothing_changes_nothing():
+    store = make_store()
+    version = store.version
+    store.delete([])
+    assert len(store) == 5 and store.version == version
+
+def test_translate_moves_only_one_annotation():
+    store = make_store()
+    before = store.coords.copy()
+    version = store.version
+    store.translate(1, 5, -3)
+    assert store.version == version + 1
+    assert np.array_equal(store.points(1), before[2:7] + (5, -3))
+    assert np.array_equal(store.coords[:2], before[:2])
+    assert np.array_equal(store.coords[7:], before[7:])
+
+def test_copy_is_independent():
+    store = make_store()
+    copy = store.copy()
+    store.translate(0, 1, 1)
+    store.set_label([1], "bush")
+    store.delete([4])
+    assert len(copy) == 5
+    assert copy.get(0)["points"] == [(0.0, 0.0), (100.0, 100.0)]
+    assert copy.label(1) == "tree"
+    assert copy.append("BBox", "car", [(0, 0), (1, 1)]) == store.next_id
+
+def test_grid_index_queries_by_bounding_box():
+    store = make_store()
+    index = indexed(store)
+    assert index.query_rect(0, 0, 50, 50) == {0, 1, 2}
+    assert index.query_rect(150, 150, 1000, 1000) == {3}
+    assert index.query_rect(101, 101, 199, 199) == set()
+    # A rectangle larger than the occupied area scans the occupied cells instead
+    assert index.query_rect(-1e6, -1e6, 1e6, 1e6) == {0, 1, 2, 3, 4}
+    assert index.query_point(305, 5) == {4}
+    assert index.query_point(312, 12) == set()
+    assert index.query_point(312, 12, tolerance=3) == {4}
+    index.remove(0)
+    assert index.query_rect(0, 0, 50, 50) == {1, 2}
+    assert len(index) == 4
+
+def test_hit_test_picks_the_smallest_annotation_under_the_point():
+    store = make_store()
+    index = indexed(store)
+    assert index.hit_test(30, 30, store) == 2 # inside the big box, the polygon and the small box
+    assert index.hit_test(12, 30, store) == 1 # inside the big box and the polygon
+    assert index.hit_test(70, 70, store) == 0
+    assert index.hit_test(230, 210, store) == 3
+    assert index.hit_test(258, 245, store) is None # in the triangle's bounding box, outside the triangle
+    assert index.hit_test(150, 150, store) is None
+
+def test_hit_test_without_interior_only_hits_outlines():
+    store = make_store()
+    index = indexed(store)
+    assert index.hit_test(70, 70, store, tolerance=2, interior=False) is None
+    assert index.hit_test(99, 70, store, tolerance=2, interior=False) == 0
+    assert index.hit_test(102, 70, store, tolerance=2, interior=False) == 0
+    assert index.hit_test(31, 25, store, tolerance=2, interior=False) == 1
+    assert index.hit_test(230, 201, store, tolerance=2, interior=False) == 3
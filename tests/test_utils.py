@@ -0,0 +1,105 @@
+import json
+import pytest
+import numpy as np
+import coco
+from store import AnnotationStore
+from coco import CocoIndex
+from utils import save_annotations, load_annotations, CocoDatasetWriter, FORMAT_EXTENSIONS
+
+IMAGE_SIZE = (640, 480)
+CLASSES = ["car", "tree", "bus"]
+
+def make_store():
+    store = AnnotationStore()
+    store.append("BBox", "car", [(10, 20), (110, 220)])
+    store.append("Polygon", "tree", [(300, 100), (350, 120), (340, 200), (290, 180)])
+    store.append("BBox", "bus", [(0.5, 1.5), (639.5, 479)])
+    store.append("Polygon", "car", [(20, 300), (60, 310), (40, 360)])
+    return store
+
+def shapes(store):
+    return [(store.type_name(i), store.label(i), store.points(i).tolist()) for i in range(len(store))]
+
+def as_boxes(store):
+    return [("BBox", store.label(i), [list(store.bbox(i)[:2]), list(store.bbox(i)[2:])]) for i in range(len(store))]
+
+def export_and_import(tmp_path, fmt, store):
+    image_path = str(tmp_path / "photo.jpg")
+    file_path = str(tmp_path / ("photo" + FORMAT_EXTENSIONS[fmt]))
+    save_annotations(fmt, file_path, store, image_path, IMAGE_SIZE, CLASSES)
+    return file_path, image_path
+
+def test_coco_round_trip_keeps_boxes_and_polygons(tmp_path):
+    store = make_store()
+    file_path, image_path = export_and_import(tmp_path, "coco", store)
+    assert shapes(load_annotations("coco", file_path, image_path)) == shapes(store)
+
+def test_python_dict_round_trip_groups_by_label(tmp_path):
+    store = make_store()
+    file_path, image_path = export_and_import(tmp_path, "python_dict", store)
+    assert sorted(shapes(load_annotations("python_dict", file_path, image_path))) == sorted(shapes(store))
+
+def test_pascal_voc_round_trip_keeps_bounding_boxes(tmp_path):
+    store = make_store()
+    file_path, image_path = export_and_import(tmp_path, "pascal_voc", store)
+    assert shapes(load_annotations("pascal_voc", file_path, image_path)) == as_boxes(store)
+
+def test_yolo_round_trip_through_the_dispatcher(tmp_path):
+    # save_annotations passes every backend the same arguments; YOLO export used to raise TypeError here
+    store = make_store()
+    file_path, image_path = export_and_import(tmp_path, "yolo", store)
+    loaded = load_annotations("yolo", file_path, image_path, IMAGE_SIZE, CLASSES)
+    assert [label for _, label, _ in shapes(loaded)] == [label for _, label, _ in as_boxes(store)]
+    for (_, _, points), (_, _, expected) in zip(shapes(loaded), as_boxes(store)):
+        assert np.allclose(points, expected, atol=1e-3)
+
+def test_yolo_leaves_out_labels_missing_from_the_class_list(tmp_path):
+    store = make_store()
+    store.append("BBox", "dog", [(1, 1), (2, 2)])
+    file_path, image_path = export_and_import(tmp_path, "yolo", store)
+    (tmp_path / "classes.txt").write_text("\n".join(CLASSES))
+    assert len(load_annotations("yolo", file_path, image_path, IMAGE_SIZE)) == len(store) - 1
+
+def test_coco_import_picks_the_image_by_file_name(tmp_path):
+    file_path = str(tmp_path / "dataset.json")
+    with CocoDatasetWriter(file_path, CLASSES) as writer:
+        for n in range(3):
+            store = AnnotationStore()
+            for k in range(n + 1):
+                store.append("BBox", CLASSES[k], [(k, n), (k + 10, n + 10)])
+            writer.add(store, f"image{n}.jpg", IMAGE_SIZE)
+    loaded = load_annotations("coco", file_path, str(tmp_path / "image2.jpg"))
+    assert shapes(loaded) == [("BBox", CLASSES[k], [[k, 2], [k + 10, 12]]) for k in range(3)]
+    with pytest.raises(ValueError, match="no entry for other.jpg"):
+        load_annotations("coco", file_path, "other.jpg")
+
+def test_coco_index_byte_offsets_across_chunk_boundaries(tmp_path, monkeypatch):
+    # Non-ASCII file names before the annotations: offsets must count bytes, not characters
+    images = [{"id": n, "file_name": f"bild-ä{n}-日本.jpg", "width": 640, "height": 480} for n in range(5)]
+    annotations = [{"id": k, "image_id": k % 5, "category_id": k % 3, "bbox": [k, k + 0.25, 10.5, 20], "area": 210.0, "iscrowd": 0,
+                    "segmentation": [[k, k, k + 10.5, k, k + 10.5, k + 20, k, k + 20]]} for k in range(40)]
+    document = {"info": {"description": "Ünïcode"}, "images": images, "annotations": annotations, "categories": [{"id": i, "name": name} for i, name in enumerate(CLASSES)]}
+    path = tmp_path / "dataset.json"
+    path.write_text(json.dumps(document, ensure_ascii=False, indent=1), encoding="utf-8")
+
+    for chunk_size in (1, 7, 64, 1 << 20):
+        monkeypatch.setattr(coco, "CHUNK_SIZE", chunk_size)
+        index = CocoIndex(str(path), use_cache=False)
+        assert index.image_id("bild-ä3-日本.jpg") == 3
+        assert index.categories == dict(enumerate(CLASSES))
+        for n in range(5):
+            expected = [ann for ann in annotations if ann["image_id"] == n]
+            assert index.annotation_count(n) == len(expected)
+            assert index.annotations(n) == expected
+
+def test_coco_index_is_reused_until_the_file_changes(tmp_path):
+    file_path = str(tmp_path / "dataset.json")
+    store = make_store()
+    save_annotations("coco", file_path, store, "photo.jpg", IMAGE_SIZE, CLASSES)
+    index = CocoIndex(file_path)
+    assert (tmp_path / "dataset.json.index.npz").exists()
+    cached = CocoIndex(file_path)
+    assert cached.images == index.images and cached.annotations(0) == index.annotations(0)
+    store.delete([0])
+    save_annotations("coco", file_path, store, "photo.jpg", IMAGE_SIZE, CLASSES)
+    assert CocoIndex(file_path).annotation_count(0) == len(store)
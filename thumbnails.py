@@ -0,0 +1,140 @@
+import os
+import hashlib
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from PIL import Image
+from dataset import atomic_file
+
+THUMBNAIL_SIZE = 128
+DISK_BUDGET = 256 << 20 # bytes of thumbnails kept on disk
+EVICT_EVERY = 256 # thumbnails written between disk budget checks
+
+def default_cache_dir():
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "image-annotator", "thumbnails")
+
+def make_thumbnail(image_path, thumbnail_path, size=THUMBNAIL_SIZE):
+    """Write a JPEG thumbnail of image_path that fits in size x size. Runs in a worker process."""
+    with Image.open(image_path) as image:
+        # draft() lets JPEGs decode at 1/2 to 1/8 scale instead of full size
+        image.draft("RGB", (size, size))
+        image.thumbnail((size, size), Image.Resampling.BILINEAR, reducing_gap=2.0)
+        if image.mode != "RGB": image = image.convert("RGB")
+        with atomic_file(thumbnail_path, "wb") as f:
+            image.save(f, "JPEG", quality=85)
+    return thumbnail_path
+
+class ThumbnailCache:
+    """Persistent thumbnails for image files, built on a process pool.
+
+    A thumbnail is keyed by the image's absolute path, mtime and size, so an
+    edited image gets a new one while an untouched image is never decoded
+    again across runs. Only thumbnails that are asked for are built, and
+    requests that are no longer wanted (rows scrolled away) are cancelled
+    before they start. The cache directory is trimmed back to disk_budget
+    bytes, least recently used first.
+    """
+    def __init__(self, cache_dir=None, size=THUMBNAIL_SIZE, disk_budget=DISK_BUDGET, workers=None):
+        self.cache_dir = cache_dir or default_cache_dir()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.size = size
+        self.disk_budget = disk_budget
+        # Leave cores for the UI and the annotator's own decoding
+        self.workers = workers or max(1, (os.cpu_count() or 2) // 2)
+        self.executor = self._start_executor()
+        self.pending = {} # image path -> Future
+        self.ready = set() # image paths whose thumbnail finished since the last poll
+        self.failed = set()
+        self.lock = threading.Lock()
+        self.written = 0
+        threading.Thread(target=self.evict, daemon=True).start()
+
+    def _start_executor(self):
+        # Workers are spawned, not forked: a fork would copy the Tk process along with locks held by its other threads
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def thumbnail_path(self, image_path):
+        stat = os.stat(image_path)
+        key = f"{os.path.abspath(image_path)}\0{stat.st_mtime_ns}\0{stat.st_size}\0{self.size}"
+        return os.path.join(self.cache_dir, hashlib.sha1(key.encode("utf-8", "surrogateescape")).hexdigest() + ".jpg")
+
+    def get(self, image_path):
+        """Path of the cached thumbnail, or None after queueing it to be built."""
+        if image_path in self.failed: return None
+        try:
+            thumbnail_path = self.thumbnail_path(image_path)
+        except OSError:
+            return None
+        try:
+            os.utime(thumbnail_path) # mark as recently used for eviction
+            return thumbnail_path
+        except FileNotFoundError:
+            pass # not built yet, or evicted since
+        with self.lock:
+            if image_path in self.pending: return None
+            try:
+                future = self.executor.submit(make_thumbnail, image_path, thumbnail_path, self.size)
+            except BrokenProcessPool:
+                # A worker died (killed, or out of memory on a huge image); the builds it took down are marked failed
+                self.executor.shutdown(wait=False)
+                self.executor = self._start_executor()
+                future = self.executor.submit(make_thumbnail, image_path, thumbnail_path, self.size)
+            self.pending[image_path] = future
+        # Outside the lock: the callback runs right here if the build already finished
+        future.add_done_callback(lambda future: self._done(image_path, future))
+        return None
+
+    def _done(self, image_path, future):
+        with self.lock:
+            self.pending.pop(image_path, None)
+            if future.cancelled(): return
+            if future.exception() is not None:
+                self.failed.add(image_path)
+                return
+            self.ready.add(image_path)
+            self.written += 1
+            evict = self.written % EVICT_EVERY == 0
+        if evict: threading.Thread(target=self.evict, daemon=True).start()
+
+    def keep_only(self, image_paths):
+        """Cancel queued builds for images no longer in view."""
+        image_paths = set(image_paths)
+        with self.lock:
+            unwanted = [future for image_path, future in self.pending.items() if image_path not in image_paths]
+        # cancel() runs _done, which takes the lock
+        for future in unwanted:
+            future.cancel()
+
+    def take_ready(self):
+        """Image paths whose thumbnails were built since the last call."""
+        with self.lock:
+            ready, self.ready = self.ready, set()
+        return ready
+
+    def busy(self):
+        with self.lock:
+            return bool(self.pending)
+
+    def evict(self):
+        """Delete the least recently used thumbnails until the cache fits in disk_budget."""
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(".jpg"):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.disk_budget: break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
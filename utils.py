@@ -2,30 +2,48 @@ import xml.etree.ElementTree as ET
 from xml.dom import minidom
 import os
 import json
+from functools import lru_cache
+import ast
 import pprint
+import shutil
+import tempfile
+from contextlib import ExitStack
+import numpy as np
+from store import AnnotationStore, BBOX, to_python
+from dataset import atomic_file, atomic_write
+from coco import CocoIndex
+
+FORMAT_EXTENSIONS = {
+    "python_dict": ".py",
+    "coco": ".json",
+    "pascal_voc": ".xml",
+    "yolo": ".txt"
+}
 
 def save_annotations(format_type, file_path, annotations, image_path, image_size, class_list):
-    """Dispatcher function to save annotations in the specified format."""
+    """Dispatcher function to save annotations in the specified format.
+
+    annotations is an AnnotationStore; a list of annotation dicts is converted first.
+    Every format is written atomically, so an interrupted export never leaves a partial file.
+    """
     dispatch = {
         "pascal_voc": _save_pascal_voc,
         "coco": _save_coco,
         "yolo": _save_yolo,
         "python_dict": _save_python_dict
     }
+    if not isinstance(annotations, AnnotationStore):
+        annotations = AnnotationStore.from_dicts(annotations)
     if format_type in dispatch:
         dispatch[format_type](file_path, annotations, image_path, image_size, class_list)
 
-def _get_bbox_from_polygon(points):
-    """Calculate the bounding box coordinates for a given polygon."""
-    x_coords = [p[0] for p in points]
-    y_coords = [p[1] for p in points]
-    xmin = min(x_coords)
-    ymin = min(y_coords)
-    xmax = max(x_coords)
-    ymax = max(y_coords)
-    return xmin, ymin, xmax, ymax
-
-def _save_pascal_voc(file_path, annotations, image_path, image_size, class_list):
+def _category_ids(store, class_list, missing):
+    """Map every annotation's label to its index in class_list, or missing."""
+    cat_map = {name: i for i, name in enumerate(class_list)}
+    lookup = np.array([cat_map.get(name, missing) for name in store.labels] or [missing], dtype=np.int64)
+    return lookup[store.label_ids]
+
+def _save_pascal_voc(file_path, store, image_path, image_size, class_list):
     annotation_el = ET.Element("annotation")
     ET.SubElement(annotation_el, "folder").text = os.path.dirname(image_path)
     ET.SubElement(annotation_el, "filename").text = os.path.basename(image_path)
@@ -37,17 +55,11 @@ def _save_pascal_voc(file_path, annotations, image_path, image_size, class_list)
     ET.SubElement(size_el, "width").text = str(width)
     ET.SubElement(size_el, "height").text = str(height)
     ET.SubElement(size_el, "depth").text = "3"
-    ET.SubElement(annotation_el, "segmented").text = str(int(any(ann["type"] == "Polygon" for ann in annotations)))
-
-    for ann_data in annotations:
-        if ann_data["type"] == "BBox":
-            xmin, ymin = ann_data["points"][0]
-            xmax, ymax = ann_data["points"][1]
-        else: # Polygon
-            xmin, ymin, xmax, ymax = _get_bbox_from_polygon(ann_data["points"])
+    ET.SubElement(annotation_el, "segmented").text = str(int(bool((store.types != BBOX).any())))
 
+    for label_id, (xmin, ymin, xmax, ymax) in zip(store.label_ids.tolist(), to_python(store.bboxes())):
         obj_el = ET.SubElement(annotation_el, "object")
-        ET.SubElement(obj_el, "name").text = ann_data["label"]
+        ET.SubElement(obj_el, "name").text = store.labels[label_id]
         ET.SubElement(obj_el, "pose").text = "Unspecified"
         ET.SubElement(obj_el, "truncated").text = "0"
         ET.SubElement(obj_el, "difficult").text = "0"
@@ -59,74 +71,212 @@ def _save_pascal_voc(file_path, annotations, image_path, image_size, class_list)
 
     xml_str = ET.tostring(annotation_el)
     pretty_xml_str = minidom.parseString(xml_str).toprettyxml(indent="   ")
-    with open(file_path, "w") as f:
-        f.write(pretty_xml_str)
+    atomic_write(file_path, pretty_xml_str)
 
-def _save_coco(file_path, annotations, image_path, image_size, class_list):
-    width, height = image_size
-    cat_map = {name: i for i, name in enumerate(class_list)}
-    categories = [{"id": i, "name": name, "supercategory": "none"} for i, name in enumerate(class_list)]
-    images = [{"id": 0, "file_name": os.path.basename(image_path), "height": height, "width": width}]
-    
-    coco_annotations = []
-    for i, ann_data in enumerate(annotations):
-        label = ann_data["label"]
-        points = ann_data["points"]
-        
-        if ann_data["type"] == "BBox":
-            xmin, ymin = points[0]
-            xmax, ymax = points[1]
-            segmentation = [[xmin, ymin, xmax, ymin, xmax, ymax, xmin, ymax]]
-        else: # Polygon
-            segmentation = [[coord for point in points for coord in point]]
-
-        xmin, ymin, xmax, ymax = _get_bbox_from_polygon(points if ann_data["type"] == "Polygon" else [points[0], points[1]])
-        coco_bbox = [xmin, ymin, xmax - xmin, ymax - ymin]
-        area = coco_bbox[2] * coco_bbox[3]
-
-        coco_annotations.append({
-            "id": i,
-            "image_id": 0,
-            "category_id": cat_map.get(label, -1),
+def _coco_annotations(store, category_ids, image_id, first_id):
+    """COCO annotation records for one image's store, numbered from first_id."""
+    bboxes = store.bboxes()
+    coco_bboxes = np.column_stack((bboxes[:, :2], bboxes[:, 2:] - bboxes[:, :2]))
+    areas = coco_bboxes[:, 2] * coco_bboxes[:, 3]
+    # BBoxes are stored as two corners; their segmentation is the four-corner outline
+    flat_coords = to_python(store.coords.ravel())
+    offsets = (store.offsets * 2).tolist()
+    corners = to_python(bboxes[:, [0, 1, 2, 1, 2, 3, 0, 3]])
+    is_box = (store.types == BBOX).tolist()
+
+    for i, (category_id, coco_bbox, area) in enumerate(zip(category_ids.tolist(), to_python(coco_bboxes), to_python(areas))):
+        segmentation = [corners[i] if is_box[i] else flat_coords[offsets[i]:offsets[i + 1]]]
+        yield {
+            "id": first_id + i,
+            "image_id": image_id,
+            "category_id": category_id,
             "bbox": coco_bbox,
             "area": area,
             "iscrowd": 0,
             "segmentation": segmentation
-        })
+        }
 
-    with open(file_path, 'w') as f:
-        json.dump({"images": images, "annotations": coco_annotations, "categories": categories}, f, indent=4)
+def _coco_image(image_id, image_path, image_size):
+    width, height = image_size
+    return {"id": image_id, "file_name": os.path.basename(image_path), "height": height, "width": width}
+
+def _coco_categories(class_list):
+    return [{"id": i, "name": name, "supercategory": "none"} for i, name in enumerate(class_list)]
 
-def _save_yolo(file_path, annotations, image_size, class_list):
+def _save_coco(file_path, store, image_path, image_size, class_list):
+    categories = _coco_categories(class_list)
+    images = [_coco_image(0, image_path, image_size)]
+    coco_annotations = list(_coco_annotations(store, _category_ids(store, class_list, -1), 0, 0))
+    atomic_write(file_path, json.dumps({"images": images, "annotations": coco_annotations, "categories": categories}, indent=4))
+
+def _save_yolo(file_path, store, image_path, image_size, class_list):
     img_w, img_h = image_size
-    cat_map = {name: i for i, name in enumerate(class_list)}
-    lines = []
-    for ann_data in annotations:
-        class_id = cat_map.get(ann_data["label"])
-        if class_id is None: continue
-
-        if ann_data["type"] == "BBox":
-            xmin, ymin = ann_data["points"][0]
-            xmax, ymax = ann_data["points"][1]
-        else: # Polygon
-            xmin, ymin, xmax, ymax = _get_bbox_from_polygon(ann_data["points"])
-
-        box_w, box_h = xmax - xmin, ymax - ymin
-        center_x, center_y = xmin + box_w / 2, ymin + box_h / 2
-        
-        lines.append(f"{class_id} {center_x/img_w:.6f} {center_y/img_h:.6f} {box_w/img_w:.6f} {box_h/img_h:.6f}")
-
-    with open(file_path, 'w') as f:
-        f.write('\n'.join(lines))
-
-def _save_python_dict(file_path, annotations, image_path, image_size, class_list):
+    class_ids = _category_ids(store, class_list, -1)
+    keep = class_ids >= 0
+    bboxes = store.bboxes()[keep]
+    box_wh = bboxes[:, 2:] - bboxes[:, :2]
+    centers = bboxes[:, :2] + box_wh / 2
+    rows = np.column_stack((centers / (img_w, img_h), box_wh / (img_w, img_h)))
+
+    lines = [f"{class_id} {cx:.6f} {cy:.6f} {w:.6f} {h:.6f}" for class_id, (cx, cy, w, h) in zip(class_ids[keep].tolist(), rows.tolist())]
+    atomic_write(file_path, '\n'.join(lines))
+
+def _save_python_dict(file_path, store, image_path, image_size, class_list):
     output_dict = {}
-    for ann in annotations:
-        label = ann['label']
-        points = ann['points']
+    points = [tuple(p) for p in to_python(store.coords)]
+    offsets = store.offsets.tolist()
+    for i, label_id in enumerate(store.label_ids.tolist()):
+        label = store.labels[label_id]
         if label not in output_dict:
             output_dict[label] = []
-        output_dict[label].append(points)
+        output_dict[label].append(points[offsets[i]:offsets[i + 1]])
+
+    atomic_write(file_path, f"annotations = {pprint.pformat(output_dict)}")
+
+class CocoDatasetWriter:
+    """Streams one COCO file covering many images, in memory that does not grow with the dataset.
+
+    Each image entry is written to the output as soon as it is added. Its
+    annotations go to a temporary spool file and are copied in after the
+    image list on close, so only the image being added is ever in memory.
+    Image and annotation ids are unique across the whole file. Category ids
+    come from class_list, or, when it is None, are assigned in the order
+    labels are first seen. Output is compact JSON unless indent is given,
+    and the file only appears, atomically, once close() succeeds.
+    """
+    def __init__(self, file_path, class_list=None, indent=None):
+        self.file_path = file_path
+        self.indent = indent
+        self.separators = (",", ":") if indent is None else (",", ": ")
+        self.categories = {name: i for i, name in enumerate(class_list or [])} # name -> category id
+        self.discover_categories = class_list is None
+        self.image_count = 0
+        self.annotation_count = 0
+        self.stack = ExitStack()
+        self.out = self.stack.enter_context(atomic_file(file_path))
+        self.spool = self.stack.enter_context(tempfile.TemporaryFile("w+", dir=os.path.dirname(os.path.abspath(file_path))))
+        self.out.write('{"images":[')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        if exc_info[0] is None:
+            self.close()
+        else:
+            self.stack.__exit__(*exc_info) # discards the partial output
+
+    def _dumps(self, record):
+        return json.dumps(record, indent=self.indent, separators=self.separators)
+
+    def add(self, store, image_path, image_size):
+        """Append one image and its annotations. Returns the image id."""
+        image_id = self.image_count
+        self.out.write(("," if image_id else "") + self._dumps(_coco_image(image_id, image_path, image_size)))
+        if self.discover_categories:
+            for name in store.used_labels():
+                self.categories.setdefault(name, len(self.categories))
+        if len(store):
+            records = _coco_annotations(store, _category_ids(store, list(self.categories), -1), image_id, self.annotation_count)
+            self.spool.write(("," if self.annotation_count else "") + ",".join(self._dumps(record) for record in records))
+        self.image_count += 1
+        self.annotation_count += len(store)
+        return image_id
+
+    def close(self):
+        self.out.write('],"annotations":[')
+        self.spool.seek(0)
+        shutil.copyfileobj(self.spool, self.out, 1 << 20)
+        self.out.write('],"categories":[' + ",".join(self._dumps(c) for c in _coco_categories(self.categories)) + "]}")
+        self.stack.close()
+
+# --- Import ---
+def load_annotations(format_type, file_path, image_path, image_size=None, class_list=None):
+    """Dispatcher function to read annotations back from any format save_annotations writes.
+
+    Returns an AnnotationStore. image_size is needed for YOLO, whose
+    coordinates are relative; class_list maps YOLO class ids to names (by
+    default a classes.txt next to the file is used, if there is one). A
+    COCO file may hold many images: the one whose file_name matches
+    image_path is loaded, and ValueError is raised when there is none.
+    PASCAL VOC and YOLO only keep boxes, so polygons exported to them come
+    back as their bounding boxes.
+    """
+    dispatch = {
+        "pascal_voc": _load_pascal_voc,
+        "coco": _load_coco,
+        "yolo": _load_yolo,
+        "python_dict": _load_python_dict
+    }
+    if format_type not in dispatch: raise ValueError(f"unsupported format: {format_type}")
+    return dispatch[format_type](file_path, image_path, image_size, class_list)
+
+def _load_pascal_voc(file_path, image_path, image_size, class_list):
+    store = AnnotationStore()
+    for obj_el in ET.parse(file_path).getroot().iter("object"):
+        box = obj_el.find("bndbox")
+        xmin, ymin, xmax, ymax = (float(box.find(tag).text) for tag in ("xmin", "ymin", "xmax", "ymax"))
+        store.append("BBox", obj_el.find("name").text or "", [(xmin, ymin), (xmax, ymax)])
+    return store
+
+@lru_cache(maxsize=4)
+def _coco_index(file_path, size, mtime_ns):
+    return CocoIndex(file_path)
+
+def coco_index(file_path):
+    """CocoIndex for a file, shared between calls until the file changes."""
+    stat = os.stat(file_path)
+    return _coco_index(file_path, stat.st_size, stat.st_mtime_ns)
+
+def _load_coco(file_path, image_path, image_size, class_list):
+    index = coco_index(file_path)
+    image_id = index.image_id(image_path)
+    if image_id is None and len(index.images) == 1:
+        image_id = next(iter(index.images)) # a single-image export, whatever its file name
+    if image_id is None: raise ValueError(f"no entry for {os.path.basename(image_path)}")
+    store = AnnotationStore()
+    for ann in index.annotations(image_id):
+        label = index.categories.get(ann["category_id"], str(ann["category_id"]))
+        x, y, w, h = ann["bbox"]
+        segmentation = ann.get("segmentation")
+        polygon = segmentation[0] if isinstance(segmentation, list) and segmentation else None
+        # BBoxes are exported with their four corners as the segmentation
+        if polygon is None or (len(polygon) == 8 and np.allclose(polygon, [x, y, x + w, y, x + w, y + h, x, y + h])):
+            store.append("BBox", label, [(x, y), (x + w, y + h)])
+        else:
+            store.append("Polygon", label, polygon)
+    return store
+
+def _load_yolo(file_path, image_path, image_size, class_list):
+    if class_list is None:
+        classes_path = os.path.join(os.path.dirname(file_path), "classes.txt")
+        if os.path.exists(classes_path):
+            with open(classes_path) as f:
+                class_list = f.read().splitlines()
+    img_w, img_h = image_size
+    store = AnnotationStore()
+    with open(file_path) as f:
+        for line in f:
+            parts = line.split()
+            if not parts: continue
+            class_id = int(parts[0])
+            label = class_list[class_id] if class_list and 0 <= class_id < len(class_list) else str(class_id)
+            values = np.array(parts[1:], dtype=np.float64)
+            if len(values) == 4:
+                cx, cy, w, h = values * (img_w, img_h, img_w, img_h)
+                store.append("BBox", label, [(cx - w / 2, cy - h / 2), (cx + w / 2, cy + h / 2)])
+            else:
+                # YOLO segmentation rows list normalized polygon vertices
+                store.append("Polygon", label, values.reshape(-1, 2) * (img_w, img_h))
+    return store
 
-    with open(file_path, 'w') as f:
-        f.write(f"annotations = {pprint.pformat(output_dict)}")
\ No newline at end of file
+def _load_python_dict(file_path, image_path, image_size, class_list):
+    with open(file_path) as f:
+        text = f.read()
+    output_dict = ast.literal_eval(text.split("=", 1)[1])
+    store = AnnotationStore()
+    for label, shapes in output_dict.items():
+        for points in shapes:
+            # BBoxes are written as their two corners
+            store.append("BBox" if len(points) == 2 else "Polygon", label, points)
+    return store
@@ -0,0 +1,128 @@
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+from geometry import simplify_polygon
+
+WORKING_SIZE = 1024 # longest side of the copy the wand works on
+DEFAULT_TOLERANCE = 32 # max per-channel difference from the seed color
+SIMPLIFY_TOLERANCE = 1.0 # working-copy pixels
+
+# Moore neighborhood, clockwise from west, as (dy, dx) with y pointing down
+NEIGHBORS = ((0, -1), (-1, -1), (-1, 0), (-1, 1), (0, 1), (1, 1), (1, 0), (1, -1))
+NEIGHBOR_INDEX = {offset: i for i, offset in enumerate(NEIGHBORS)}
+
+def load_working_copy(image_path, working_size=WORKING_SIZE):
+    """Decode image_path reduced to fit working_size, as an (h, w, 3) uint8 array."""
+    with Image.open(image_path) as image:
+        image.draft("RGB", (working_size, working_size))
+        image = image.convert("RGB")
+    image.thumbnail((working_size, working_size), Image.Resampling.BILINEAR)
+    return np.asarray(image)
+
+def _run_ids(mask):
+    """Label each horizontal run of True pixels with a distinct positive id; 0 elsewhere."""
+    starts = mask.copy()
+    starts[:, 1:] &= ~mask[:, :-1]
+    return np.cumsum(starts, axis=None, dtype=np.int64).reshape(mask.shape) * mask
+
+def region_grow(pixels, seed, tolerance):
+    """Boolean mask of the pixels 4-connected to seed whose color is within tolerance of the seed's.
+
+    The reference color is the median of the 3x3 neighborhood, so a seed on
+    a noisy or blended pixel still picks up its surroundings. Instead of a
+    per-pixel flood fill, similar pixels are grouped into horizontal runs,
+    runs that touch between neighboring rows are linked, and the linked
+    runs are merged into components by vectorized union-find (hook the
+    larger root under the smaller, then pointer-jump), which takes a few
+    passes over a graph with one node per run.
+    """
+    sy, sx = seed
+    window = pixels[max(0, sy - 1):sy + 2, max(0, sx - 1):sx + 2].reshape(-1, pixels.shape[-1])
+    reference = np.median(window, axis=0).astype(np.int16)
+    mask = np.abs(pixels.astype(np.int16) - reference).max(axis=-1) <= tolerance
+    mask[sy, sx] = True # the seed belongs to its region even when it is an outlier
+
+    runs = _run_ids(mask)
+    # One link per pair of overlapping runs in neighboring rows
+    upper, lower = runs[:-1], runs[1:]
+    linked = (upper > 0) & (lower > 0)
+    first = linked.copy()
+    first[:, 1:] &= ~linked[:, :-1] | (upper[:, 1:] != upper[:, :-1]) | (lower[:, 1:] != lower[:, :-1])
+    u, v = upper[first], lower[first]
+
+    parent = np.arange(int(runs.max()) + 1)
+    while True:
+        ru, rv = parent[u], parent[v]
+        if np.array_equal(ru, rv): break
+        np.minimum.at(parent, np.maximum(ru, rv), np.minimum(ru, rv))
+        while True:
+            grandparent = parent[parent]
+            if np.array_equal(grandparent, parent): break
+            parent = grandparent
+    return parent[runs] == parent[runs[sy, sx]]
+
+def trace_contour(mask):
+    """Outer boundary of a connected mask as an (n, 2) array of (x, y) pixel positions, by Moore-neighbor tracing."""
+    padded = np.pad(mask, 1)
+    start = divmod(int(np.argmax(padded)), padded.shape[1]) # topmost, then leftmost pixel
+    y, x = start
+    back = 0 # the west neighbor of the first pixel in raster order is background
+    contour = [(x - 1, y - 1)]
+    first_step = None
+    for _ in range(4 * padded.size):
+        for k in range(1, 9):
+            d = (back + k) % 8
+            dy, dx = NEIGHBORS[d]
+            if padded[y + dy, x + dx]: break
+        else:
+            break # a single pixel
+        # The last background neighbor checked becomes the backtrack point of the new pixel
+        py, px = NEIGHBORS[(d + 7) % 8]
+        back = NEIGHBOR_INDEX[(py - dy, px - dx)]
+        if first_step is None:
+            first_step = (y + dy, x + dx)
+        elif (y, x) == start and (y + dy, x + dx) == first_step:
+            contour.pop() # back at the start, about to repeat the first step
+            break
+        y, x = y + dy, x + dx
+        contour.append((x - 1, y - 1))
+    return np.array(contour, dtype=np.float64)
+
+class MagicWand:
+    """Region-grow polygon tool for one image.
+
+    A downscaled working copy of the image is decoded once, in the
+    background, and kept for every click on that image. select() grows the
+    region of similar color around a seed, traces its outline and
+    simplifies it, all on a worker thread, and returns a Future with the
+    polygon in original-image coordinates (None when nothing usable was
+    found).
+    """
+    def __init__(self, image_path, image_size, working_size=WORKING_SIZE):
+        self.image_path = image_path
+        self.image_size = image_size
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="magic-wand")
+        self.working = self.executor.submit(load_working_copy, image_path, working_size)
+
+    def select(self, x, y, tolerance=DEFAULT_TOLERANCE):
+        return self.executor.submit(self._select, x, y, tolerance)
+
+    def _select(self, x, y, tolerance):
+        pixels = self.working.result()
+        h, w = pixels.shape[:2]
+        scale_x, scale_y = self.image_size[0] / w, self.image_size[1] / h
+        col, row = int(x / scale_x), int(y / scale_y)
+        if not (0 <= col < w and 0 <= row < h): return None
+        region = region_grow(pixels, (row, col), tolerance)
+        if not region.any(): return None
+        # Pixel centers of the working copy
+        outline = simplify_polygon(trace_contour(region), SIMPLIFY_TOLERANCE) + 0.5
+        if len(outline) < 3:
+            # A sliver one pixel wide traces to a line: outline its bounding box instead
+            rows, cols = np.nonzero(region)
+            x1, y1, x2, y2 = cols.min(), rows.min(), cols.max() + 1, rows.max() + 1
+            outline = np.array([[x1, y1], [x2, y1], [x2, y2], [x1, y2]], dtype=np.float64)
+        return np.clip(outline * (scale_x, scale_y), 0, self.image_size)
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)